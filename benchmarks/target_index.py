@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the target network lookup of reporting/masscan_report.py:
+# the TargetIndex binary search against calling contains() on every
+# target report, over random overlapping target networks and random
+# addresses. Checks both find the same targets for every address.
+#
+# Usage: target_index.py [OPTIONS]
+# OPTIONS:
+#   -n, --networks <n>      number of target networks (default: 5000)
+#   -a, --addresses <n>     number of addresses looked up (default: 2000)
+#   --seed <n>              random seed (default: 1)
+#
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "reporting"))
+from masscan_report import MasscanTargetReport, TargetIndex
+
+
+def random_networks(count, rng):
+    """returns count distinct networks, /20 to /32, inside 10.0.0.0/8 so some overlap"""
+    networks = set()
+    while len(networks) < count:
+        prefix = rng.choice((20, 22, 24, 24, 26, 28, 30, 32, 32))
+        address = ipaddress.IPv4Address(0x0a000000 + rng.randrange(1 << 24))
+        networks.add(ipaddress.IPv4Network("%s/%d" % (address, prefix), strict=False))
+    return sorted(networks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmarks the target network lookup of masscan_report.py")
+    parser.add_argument("-n", "--networks", type=int, default=5000, help="number of target networks")
+    parser.add_argument("-a", "--addresses", type=int, default=2000, help="number of addresses looked up")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reports = [MasscanTargetReport(t) for t in random_networks(args.networks, rng)]
+    addresses = [ipaddress.IPv4Address(0x0a000000 + rng.randrange(1 << 24)) for _ in range(args.addresses)]
+    # half the addresses are inside a target
+    for i in range(0, len(addresses), 2):
+        r = rng.choice(reports)
+        addresses[i] = ipaddress.IPv4Address(rng.randint(int(r.address_min), int(r.address_max)))
+
+    start = time.perf_counter()
+    linear = [[r for r in reports if r.contains(a)] for a in addresses]
+    linear_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = TargetIndex(reports)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = [list(index.lookup(a)) for a in addresses]
+    index_seconds = time.perf_counter() - start
+
+    assert [sorted(map(id, x)) for x in linear] == [sorted(map(id, x)) for x in indexed], "lookups differ"
+    matches = sum(len(x) for x in indexed)
+    print("[*] %d networks, %d addresses, %d matches" % (len(reports), len(addresses), matches))
+    print("[*] linear scan:  %.3f s (%.1f us/address)" % (linear_seconds, 1e6 * linear_seconds / len(addresses)))
+    print("[*] index build:  %.3f s (%d segments)" % (build_seconds, len(index.starts)))
+    print("[*] index lookup: %.3f s (%.1f us/address)" % (index_seconds, 1e6 * index_seconds / len(addresses)))
+    print("[*] speedup: %.0fx" % (linear_seconds / max(index_seconds, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# Writer for the per-port host files (<proto>_<port>.txt) produced
+# by scan_host_list.py and verify_and_report.py. Instead of opening
+# and closing a file for every host it keeps a bounded number of
+# files open with large write buffers, closing the least recently
+# used one when the limit is reached.
+#
+# PortHostSets collects the hosts per port during ingestion so each
+# host file is written once, sorted numerically and without duplicates.
+#
+
+import atexit
+import heapq
+import os
+import socket
+from collections import OrderedDict
+
+
+class HostFileWriter:
+    """Appends hosts to <output directory>/<proto>_<port>.txt files
+    through an LRU-bounded set of buffered file handles."""
+
+    def __init__(self, output_directory, max_open=256, buffer_size=64 * 1024):
+        self.output_directory = output_directory
+        self.max_open = max(1, max_open)
+        self.buffer_size = buffer_size
+        self.handles = OrderedDict()
+        self.closed = False
+        # make sure buffered hosts reach the disk even if the caller exits early
+        atexit.register(self.close)
+
+    def path(self, proto, port):
+        return os.path.join(self.output_directory, "%s_%s.txt" % (proto, port))
+
+    def get_handle(self, proto, port):
+        key = (proto, port)
+        handle = self.handles.get(key)
+        if handle is not None:
+            self.handles.move_to_end(key)
+            return handle
+
+        if len(self.handles) >= self.max_open:
+            # evict the least recently used file, closing it flushes the buffer
+            _, evicted = self.handles.popitem(last=False)
+            evicted.close()
+        handle = open(self.path(proto, port), 'a', buffering=self.buffer_size)
+        self.handles[key] = handle
+        return handle
+
+    def write(self, proto, port, host):
+        """Write a host to the output file for proto/port."""
+        self.get_handle(proto, port).write("%s\n" % host)
+
+    def write_hosts(self, proto, port, hosts):
+        """Write an iterable of hosts to the output file for proto/port."""
+        self.get_handle(proto, port).writelines("%s\n" % h for h in hosts)
+
+    def flush(self):
+        for handle in self.handles.values():
+            handle.flush()
+
+    def close(self):
+        while self.handles:
+            _, handle = self.handles.popitem(last=False)
+            handle.close()
+        if not self.closed:
+            self.closed = True
+            atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# IPv6 keys are offset past every IPv4 key so a single integer sort
+# lists the IPv4 hosts first, then the IPv6 hosts
+IPV6_OFFSET = 1 << 128
+# approximate memory used by one integer in a set, for the memory budget
+BYTES_PER_HOST = 64
+
+
+def host_key(host):
+    """returns the integer sort key for an IP address, or the host
+    string unchanged if it is not an IP address"""
+    try:
+        return int.from_bytes(socket.inet_aton(host), 'big') if ":" not in host else \
+            IPV6_OFFSET + int.from_bytes(socket.inet_pton(socket.AF_INET6, host), 'big')
+    except OSError:
+        return host
+
+
+def key_host(key):
+    """the inverse of host_key"""
+    if key < IPV6_OFFSET:
+        return socket.inet_ntoa(key.to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, (key - IPV6_OFFSET).to_bytes(16, 'big'))
+
+
+def host_sort_key(host):
+    """sort key listing IP addresses in numeric order, followed by the other host names"""
+    key = host_key(host)
+    return (1, 0, key) if isinstance(key, str) else (0, key, "")
+
+
+class PortHostSets:
+    """Unique hosts per (proto, port), held as sets of integer addresses.
+
+    When the sets hold more than memory_budget bytes they are written
+    to sorted run files under spill_directory and cleared, the runs are
+    merged back when the host files are written. Hosts that are not IP
+    addresses are kept in memory and listed after the addresses."""
+
+    def __init__(self, spill_directory, memory_budget=512 * 1024 * 1024):
+        self.spill_directory = spill_directory
+        self.max_hosts = max(1, memory_budget // BYTES_PER_HOST)
+        self.sets = {}
+        self.names = {}
+        self.runs = {}
+        self.num_hosts = 0
+        self.num_runs = 0
+
+    def add(self, proto, port, host):
+        self.add_key((proto, port), host_key(host))
+
+    def add_key(self, key, host):
+        if isinstance(host, str):
+            self.names.setdefault(key, set()).add(host)
+            return
+        hosts = self.sets.get(key)
+        if hosts is None:
+            hosts = self.sets[key] = set()
+        size = len(hosts)
+        hosts.add(host)
+        if len(hosts) != size:
+            self.num_hosts += 1
+            if self.num_hosts > self.max_hosts:
+                self.spill()
+
+    def update(self, key, hosts):
+        """Adds an iterable of host keys (as returned by host_key) to key."""
+        for host in hosts:
+            self.add_key(key, host)
+
+    def keys(self):
+        return set(self.sets) | set(self.names) | set(self.runs)
+
+    def spill(self):
+        """Writes every set to a sorted run file and clears it."""
+        os.makedirs(self.spill_directory, exist_ok=True)
+        for key, hosts in self.sets.items():
+            if not hosts:
+                continue
+            self.num_runs += 1
+            path = os.path.join(self.spill_directory, "run_%d.txt" % self.num_runs)
+            with open(path, 'w', buffering=1024 * 1024) as run_fd:
+                run_fd.writelines("%d\n" % h for h in sorted(hosts))
+            self.runs.setdefault(key, []).append(path)
+        self.sets = {}
+        self.num_hosts = 0
+
+    def sorted_hosts(self, key):
+        """Yields the unique hosts of key in numeric order."""
+        runs = [read_run(path) for path in self.runs.get(key, [])]
+        runs.append(iter(sorted(self.sets.get(key, ()))))
+        previous = None
+        for h in heapq.merge(*runs):
+            if h != previous:
+                yield key_host(h)
+                previous = h
+        yield from sorted(self.names.get(key, ()))
+
+    def write_files(self, writer):
+        """Writes one sorted, unique host file per (proto, port) through a HostFileWriter."""
+        for proto, port in sorted(self.keys(), key=lambda k: (k[0], int(k[1]) if k[1].isdigit() else 0, k[1])):
+            writer.write_hosts(proto, port, self.sorted_hosts((proto, port)))
+        self.cleanup()
+
+    def cleanup(self):
+        for paths in self.runs.values():
+            for path in paths:
+                os.remove(path)
+        self.runs = {}
+        if os.path.isdir(self.spill_directory):
+            os.rmdir(self.spill_directory)
+
+
+def read_run(path):
+    with open(path, 'r', buffering=1024 * 1024) as run_fd:
+        for line in run_fd:
+            yield int(line)
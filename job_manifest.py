@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# Job manifest of a verify_and_report.py run, kept as manifest.json in
+# the output directory so a run that crashed or was stopped can be
+# picked up again with --resume instead of starting over.
+#
+# The manifest records which stages of the run finished and, for each
+# stage that runs nmap, every job with its state (pending, running,
+# done or failed), nmap's exit code, the host file and output file of
+# its current run and the outputs still to be merged for each port.
+# Paths are stored relative to the output directory.
+#
+
+import json
+import os
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobManifest:
+    """The stages and jobs of a run, written to disk on every change."""
+
+    def __init__(self, directory, name="manifest.json"):
+        self.directory = directory
+        self.path = os.path.join(directory, name)
+        self.stages = {}
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as manifest_fd:
+                self.stages = json.load(manifest_fd)["stages"]
+
+    def save(self):
+        # replace the file in one step so a crash never leaves half a manifest
+        with open(self.path + ".tmp", 'w') as manifest_fd:
+            json.dump({"stages": self.stages}, manifest_fd, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def relative(self, path):
+        return os.path.relpath(path, self.directory)
+
+    def absolute(self, path):
+        return os.path.join(self.directory, path)
+
+    def stage(self, name):
+        return self.stages.setdefault(name, {"state": PENDING, "jobs": {}, "outputs": {}})
+
+    def stage_done(self, name):
+        return self.stages.get(name, {}).get("state") == DONE
+
+    def finish_stage(self, name):
+        self.stage(name)["state"] = DONE
+        self.save()
+
+    def jobs(self, name):
+        """returns {job id: job fields} for the jobs of stage name, paths made absolute"""
+        jobs = {}
+        for job_id, fields in self.stages.get(name, {}).get("jobs", {}).items():
+            fields = dict(fields)
+            fields["host_file"] = self.absolute(fields["host_file"])
+            fields["output_file"] = self.absolute(fields["output_file"])
+            jobs[job_id] = fields
+        return jobs
+
+    def outputs(self, name):
+        """returns {output key: [output files]} for stage name, paths made absolute"""
+        return {key: [self.absolute(path) for path in paths]
+                for key, paths in self.stages.get(name, {}).get("outputs", {}).items()}
+
+    def set_job(self, name, job_id, fields, outputs_key, outputs, save=True):
+        """Records the fields of a job, its state among them, and the outputs of its port."""
+        fields = dict(fields)
+        fields["host_file"] = self.relative(fields["host_file"])
+        fields["output_file"] = self.relative(fields["output_file"])
+        stage = self.stage(name)
+        stage["jobs"][job_id] = fields
+        stage["outputs"][outputs_key] = [self.relative(path) for path in outputs]
+        if save:
+            self.save()
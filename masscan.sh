@@ -10,7 +10,10 @@ usage () {
     echo "          single IP address"
     echo ""
     echo "Optional Arguments:"
-    echo "  -a:     perform false positive checks automatically"
+    echo "  -a:     perform false positive checks automatically, each batch of new hosts is"
+    echo "          probed with probe_services.sh while the scan is still running"
+    echo "  -b:     packets per second of the -r rate given to the service probes that run during"
+    echo "          the scan with -a (default: a fifth of -r), masscan scans at the rest"
     echo "  -d:     duration to run the scan, the duration has to be in the format:"
     echo "          <floating-point number><s|m|h|d>"
     echo "          where s is seconds (and default if no suffix provided), m is minutes, h is hours, d is days "
@@ -36,9 +39,10 @@ udp_scan=false
 echo_only=false
 auto_check=false
 resume=false
-while getopts "ad:ehul:i:m:o:p:r:st:x:" OPTION; do
+while getopts "ab:d:ehul:i:m:o:p:r:st:x:" OPTION; do
     case "$OPTION" in
         a ) auto_check=true;;
+        b ) probe_budget="$OPTARG";;
         d ) duration="$OPTARG";;
         e ) echo_only=true;;
         h ) usage; exit;;
@@ -81,6 +85,24 @@ if [ ! "$rate" ] || [ ! "$targets" ] || [ ! "$outputbase" ]; then
     exit 1
 fi
 
+# with -a the service probes run while masscan is still sending, so the
+# -r rate is split between them instead of each using all of it
+scan_rate=$rate
+probe_rate=$rate
+probe_jobs=10
+if [ "$auto_check" = true ] && [ "$resume" = false ]; then
+    probe_rate=${probe_budget:-$(expr $rate / 5)}
+    if [ "$probe_rate" -lt 1 ] || [ "$probe_rate" -ge "$rate" ]; then
+        echo "[-] the service probe rate (-b) must be at least 1 and less than the scanning rate (-r)"
+        exit 1
+    fi
+    scan_rate=$(expr $rate - $probe_rate)
+    if [ "$probe_rate" -lt "$probe_jobs" ]; then
+        probe_jobs=$probe_rate
+    fi
+    echo "[*] masscan at $scan_rate pps, service probes at $probe_rate pps"
+fi
+
 # test if necessary scripts for auto-check are in the local directory
 if [ "$auto_check" = true ]; then
     if [ ! -f "scan_host_list.py" ]; then
@@ -288,7 +310,7 @@ fi
 
 # build final command
 if [ "$resume" = false ]; then
-    masscan_cmd="$command_prefix masscan $target_specification $exclude_option --ping $adapter_option $router_option -p$port_argument --rate $rate -oL $outputbase.masscan"
+    masscan_cmd="$command_prefix masscan $target_specification $exclude_option --ping $adapter_option $router_option -p$port_argument --rate $scan_rate -oL $outputbase.masscan"
 else
     echo "[*] Resuming from paused.conf"
     masscan_cmd="$command_prefix masscan --resume paused.conf"
@@ -321,6 +343,18 @@ echo "============targets===============" >> "${logfile}"
 echo "$target_list" >> "${logfile}"
 echo "============masscan output===============" >> "${logfile}"
 
+# build the host lists while masscan is still writing its output and
+# probe the services of each batch of new hosts as soon as it is ready,
+# so service detection overlaps the scan. masscan runs at -r minus the
+# probe rate, so together they stay within -r.
+follow_pid=""
+if [ "$auto_check" = true ] && [ "$resume" = false ]; then
+    python3 scan_host_list.py --follow --status-interval 0 \
+        --on-ready "./probe_services.sh {file} $probe_jobs $probe_rate $outputbase" --on-ready-jobs $probe_jobs \
+        "$outputbase.masscan" "$outputbase" &
+    follow_pid=$!
+fi
+
 timestamp=`date`
 echo "STARTING MASSCAN - $timestamp" >> "${logfile}"
 $masscan_cmd | tee -a "${logfile}"
@@ -330,12 +364,26 @@ echo "MASSCAN FINISHED - $timestamp" >> "${logfile}"
 
 # perform service checks automatically if specified
 if [ "$auto_check" = true ]; then
-    python3 scan_host_list.py "$outputbase.masscan" "$outputbase"
-    if [ $? -ne 0 ]; then
-        echo "[-] scan_host_list.py job failed"
-        exit 1
+    if [ -n "$follow_pid" ]; then
+        # the follower stops at masscan's "# end" line, stop it if masscan exited without one.
+        # Either way it writes the remaining hosts as a last batch and waits for every probe.
+        if ! grep -q "^# end" "$outputbase.masscan" 2>/dev/null; then
+            kill $follow_pid 2>/dev/null
+        fi
+        wait $follow_pid
+        if [ $? -ne 0 ]; then
+            echo "[-] scan_host_list.py job failed"
+            exit 1
+        fi
+        echo "[*] all service detection jobs complete"
+    else
+        python3 scan_host_list.py "$outputbase.masscan" "$outputbase"
+        if [ $? -ne 0 ]; then
+            echo "[-] scan_host_list.py job failed"
+            exit 1
+        fi
+        ./probe_services.sh "$outputbase" $probe_jobs "$rate"
     fi
-    ./probe_services.sh "$outputbase" 10 "$rate"
 fi
 
 exit 0
\ No newline at end of file
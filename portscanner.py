@@ -2,106 +2,134 @@
 #
 # Python port scanner
 #
-# Usage: portscanner.py <targets> <port list>
+# Usage: portscanner.py [OPTIONS] <targets> <port list>
 #	targets: 	a list of IP addresses, host names, or network IDs
 #				separated by commas. Valid formats:
 #					192.168.1.1 - individual IP address
 #					192.168.1.0/24 - network id and subnet mask
 #					gateway.localdomain.local - hostname
 #	port list:	a list of TCP ports to scan, separated by commas
+#	-t, --timeout:	connect timeout in seconds (default 3)
+#	--status-interval, --metrics-prom, --metrics-json:
+#				live status line, Prometheus textfile and
+#				JSON summary, see scan_metrics.py
+#	--profile, --profile-cprofile:
+#				per-stage timings and memory, see scan_profiling.py
 #
 
+import argparse
+import ipaddress
 import re
 import socket
 import sys
 import time
 
+from scan_metrics import add_metrics_arguments, metrics_from_args
+from scan_profiling import add_profile_arguments, profiler_from_args
+
 
 def main():
 	"""main function"""
 
-	#print("sys.argv = [%s]" % (sys.argv))
-	if len(sys.argv) != 3:
-		print("[-] Illegal number of arguments")
-		print_help()
-		sys.exit(1)
+	parser = argparse.ArgumentParser(description="Python port scanner")
+	parser.add_argument("-t", "--timeout", type=float, default=3.0, help="connect timeout in seconds, a timeout is reported as filtered")
+	add_metrics_arguments(parser)
+	add_profile_arguments(parser)
+	parser.add_argument("targets", help="comma-separated IP addresses, network IDs or host names")
+	parser.add_argument("ports", help="comma-separated TCP ports")
+	args = parser.parse_args()
 
-	targets = sys.argv[1]
-	ports = sys.argv[2]
+	targets = args.targets
+	ports = args.ports
 
 	print("[*] port_list = [%s], targets = [%s]" % (ports, targets))
 
 	# create lists of ports and targets
 	port_list = ports.split(',')
 	target_list = targets.split(',')
+	profiler = profiler_from_args("portscanner", args)
+	metrics = metrics_from_args("portscanner", args, progress="probes_sent", profiler=profiler)
 
 	# traverse the list of targets, first identify
 	# the type of entry (IP address, network + mask, hostname)
 	# expand or resolved into an IP address list, combine
 	# into a full list of target IP addresses
 	all_ip_addresses = []
-	for t in target_list:
-		if re.match('\d+\.\d+\.\d+\.\d+', t):
-			# ip address
-			all_ip_addresses.append(t)
-		elif re.match('\d+\.\d+\.\d+\.\d+/\d+', t):
-			# network and subnet mask
-			network = ipaddress.IPv4Network(t)
-			ipaddresses = list(network.hosts())
-			for i in ipaddresses:
-				all_ip_addresses.append(str(i))
-		else:
-			# assume hostname if no match above
-			# get the IP address for the hostname
-			try:
-				address = socket.gethostbyname(t)
-			except socket.gaierror:
-				print('[-] cannot resolve hostname: %s' % (t))
-				sys.exit(1)
-			all_ip_addresses.append(address)
+	with metrics.phase("resolve"):
+		for t in target_list:
+			if re.match('\d+\.\d+\.\d+\.\d+', t):
+				# ip address
+				all_ip_addresses.append(t)
+			elif re.match('\d+\.\d+\.\d+\.\d+/\d+', t):
+				# network and subnet mask
+				network = ipaddress.IPv4Network(t)
+				ipaddresses = list(network.hosts())
+				for i in ipaddresses:
+					all_ip_addresses.append(str(i))
+			else:
+				# assume hostname if no match above
+				# get the IP address for the hostname
+				try:
+					address = socket.gethostbyname(t)
+				except socket.gaierror:
+					print('[-] cannot resolve hostname: %s' % (t))
+					sys.exit(1)
+				all_ip_addresses.append(address)
 
 	# with the list of all addresses perform the scan
+	metrics.total = len(all_ip_addresses) * len(port_list)
+	for k in ['open', 'closed', 'filtered', 'timeouts', 'errors']:
+		metrics.inc(k, 0)
+	metrics.set('in_flight', 0)
 	results = {}
-	for i in all_ip_addresses:
-		start = time.time()
-		address_port_results = {}
-		for p in port_list:
-			port = int(p)
-			address_port_results[p] = 'closed'
-			try:
-				sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-				result = sock.connect((i, port))
-				if result is None:
-					address_port_results[p] = 'open'
-				sock.close()
-			except socket.error:
-				print("[-] could not connect to server %s:%s" % (i, p))
-			except socket.gaierror:
-				print("[-] error resolving hostname %s:%s" % (i, p))
-			except socket.timeout:
-				print("[-] timeout connecting to %s:%s" % (i, p))
-			except ConnectionRefusedError:
-				address_port_results[p] = 'closed'
-			except:
-				print("[-] unknown error for %s:%s" % (i, p))
-
-		results[i] = address_port_results
-		end = time.time()
-		elapsed_time = end - start
-		print("[*] performed scan on %s in %f seconds" % (i, elapsed_time))
+	with metrics.phase("scan"):
+		for i in all_ip_addresses:
+			start = time.time()
+			address_port_results = {}
+			for p in port_list:
+				port = int(p)
+				address_port_results[p] = probe_port(i, port, args.timeout, metrics)
+				metrics.update()
+
+			results[i] = address_port_results
+			end = time.time()
+			elapsed_time = end - start
+			print("[*] performed scan on %s in %f seconds" % (i, elapsed_time))
 
+	metrics.finish(args.metrics_json)
+	profiler.finish()
 	print(results)
 
-def print_help():
-	"""prints a help message"""
 
-	print("""Usage: portscanner.py <targets> <port list>
-targets: 	a list of IP addresses, host names, or network IDs
-			separated by commas. Valid formats:
-				192.168.1.1 - individual IP address
-				192.168.1.0/24 - network id and subnet mask
-				gateway.localdomain.local - hostname
-port list:	a list of TCP ports to scan, separated by commas""")
+def probe_port(address, port, timeout, metrics):
+	"""connects to address:port, returns open, closed or filtered"""
+	state = 'filtered'
+	metrics.inc('probes_sent')
+	metrics.set('in_flight', 1)
+	start = time.monotonic()
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.settimeout(timeout)
+	try:
+		sock.connect((address, port))
+		state = 'open'
+	except ConnectionRefusedError:
+		state = 'closed'
+	except socket.timeout:
+		metrics.inc('timeouts')
+		print("[-] timeout connecting to %s:%s" % (address, port))
+	except socket.gaierror:
+		metrics.inc('errors')
+		print("[-] error resolving hostname %s:%s" % (address, port))
+	except socket.error:
+		metrics.inc('errors')
+		print("[-] could not connect to server %s:%s" % (address, port))
+	finally:
+		sock.close()
+	metrics.observe('connect_seconds', time.monotonic() - start)
+	metrics.set('in_flight', 0)
+	metrics.inc(state)
+	metrics.set('timeout_rate', metrics.counters['timeouts'] / metrics.counters['probes_sent'])
+	return state
 
 
 if __name__ == "__main__":
@@ -1,12 +1,21 @@
 #!/usr/bin/env bash
 #
 # Usage: probe_services.sh <directory> <num jobs> <max packets per second>
+#        probe_services.sh <host file> <num jobs> <max packets per second> [output directory]
 #
 # Checks for false positives given a directory
 # as output by the scan_host_list.py utility.
+#
+# Given a single <proto>_<port>_<n>.txt batch file, as written by
+# scan_host_list.py --follow, only that batch is probed, at the
+# pps of one of <num jobs> jobs, into
+# <output directory>/service_version_<proto>_<port>_<n>.gnmap
+# (default: the directory of the batch file). This is the form
+# scan_host_list.py --on-ready runs while the scan is going on.
 
-if [ $# -ne 3 ]; then
+if [ $# -ne 3 ] && [ $# -ne 4 ]; then
     echo "Usage: probe_services.sh <directory> <num jobs> <max packets per second>"
+    echo "       probe_services.sh <host file> <num jobs> <max packets per second> [output directory]"
     exit 1
 fi
 
@@ -15,10 +24,35 @@ num_jobs=$2
 pps=$3
 
 pps_per_job=$(expr $pps / $num_jobs)
+
+# probe a single batch file
+if [ -f "$directory" ]; then
+    f=$directory
+    output_directory=${4:-$(dirname "$f")}
+    filename=$(basename "$f" .txt)
+    proto=$(echo "$filename" | cut -d "_" -f 1)
+    port=$(echo "$filename" | cut -d "_" -f 2)
+    if [ ${proto} == "icmp" ]; then
+        exit 0
+    fi
+    if [ ${proto} == "udp" ]; then
+        scan_type_option="-sU"
+    else
+        scan_type_option=""
+    fi
+    nmap $scan_type_option --quiet --max-rate $pps_per_job -p $port -sV -Pn -iL "$f" \
+        -oG "$output_directory/service_version_$filename.gnmap"
+    exit $?
+fi
+
 echo "[*] using $pps_per_job pps/job"
 
 running_jobs=0
 for f in ${directory}/*; do
+    # skip the batches directory written by scan_host_list.py --follow
+    [ -f "$f" ] || continue
+    # only the <proto>_<port>.txt host files, not the nmap output
+    [[ "$f" == *.txt ]] || continue
     filename=$(basename "$f")
     echo "[*] processing $filename"
     proto=$(echo "$filename" | cut -d "_" -f 1)
@@ -26,7 +60,8 @@ for f in ${directory}/*; do
     echo "[*] protocol = $proto, port = $port"   
 
     if [ ${proto} != "icmp" ]; then
-        num_hosts=$(cat "$f" | sort | uniq | wc -l | sed 's/^ *//') 
+        # scan_host_list.py writes each host once, so the line count is the host count
+        num_hosts=$(wc -l < "$f" | sed 's/^ *//')
         scan_file=$directory"/service_version_"$proto"_"$port".gnmap"
         if [ ${proto} == "udp" ]; then
             scan_type_option="-sU"
@@ -8,16 +8,33 @@
 # Optional arguments:
 #   -s <service detection directory>
 #   -c <csv output file>
+#   -C <csv detail output file>
+#   -j <n>  processes reading the service detection directory (default: number of CPUs)
+#   --numpy parse the masscan file in blocks with NumPy, if it is installed
+#   --profile <file>, --profile-cprofile <file>
 #
 
 import argparse
+import bisect
 import csv
 import ipaddress
+import multiprocessing
 import os
-import random
-import string
+import socket
 import sys
-from operator import itemgetter, attrgetter
+import time
+from array import array
+from operator import attrgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from scan_metrics import add_metrics_arguments, metrics_from_args
+from scan_profiling import add_profile_arguments, profiler_from_args
+from scan_readers import parse_gnmap_line
 
 
 # nmap top 1000 TCP services and top 100 UDP services
@@ -1129,17 +1146,15 @@ class MasscanTargetReport():
     def __init__(self, target=None, service_info=None):
         '''initializes the object'''
         self.target_network = target
-        self.hosts = []
-        for h in self.target_network.hosts():
-            self.hosts.append(h)
-        
-        # self.hosts is empty if target is a single host
-        if len(self.hosts) == 0:
-            self.address_min = target.network_address
-            self.address_max = target.network_address
-        else:
-            self.address_min = min(self.hosts)
-            self.address_max = max(self.hosts)
+        # the bounds of target.hosts(), without listing them: a /31 or /32
+        # has no network and broadcast address to leave out
+        first = int(target.network_address)
+        last = int(target.broadcast_address)
+        if target.prefixlen < 31:
+            first += 1
+            last -= 1
+        self.address_min = ipaddress.IPv4Address(first)
+        self.address_max = ipaddress.IPv4Address(last)
         self.open_tcp = set()
         self.open_udp = set()
         self.service_information = service_info
@@ -1155,7 +1170,8 @@ class MasscanTargetReport():
         
         if self.service_information is not None:
             service_detections = {}
-            for h in self.hosts:
+            # only the hosts with detections inside the target's bounds
+            for h in self.service_information.hosts_in_range(self.address_min, self.address_max):
                 service_info = self.service_information.get_service_info(h)
                 if service_info is not None:
                     # service_info = {'tcp/22': ['open', 'ssh', 'OpenSSH ...'], }
@@ -1221,71 +1237,329 @@ class MasscanTargetReport():
         return result
 
 
+class TargetIndex:
+    """Finds the target reports containing an address with a binary search over
+    the integer bounds of the targets. Overlapping targets split the address
+    space into segments, each segment lists every target covering it."""
+
+    def __init__(self, reports):
+        # boundary -> (reports starting there, reports ending just before it)
+        events = {}
+        for r in reports:
+            events.setdefault(int(r.address_min), ([], []))[0].append(r)
+            events.setdefault(int(r.address_max) + 1, ([], []))[1].append(r)
+        self.starts = []
+        self.segments = []
+        active = []
+        for point in sorted(events):
+            starting, ending = events[point]
+            if ending:
+                ending = set(map(id, ending))
+                active = [r for r in active if id(r) not in ending]
+            active.extend(starting)
+            self.starts.append(point)
+            self.segments.append(tuple(active))
+
+    def lookup(self, address):
+        """returns the target reports containing address, an IPv4Address or integer"""
+        i = bisect.bisect_right(self.starts, int(address)) - 1
+        return self.segments[i] if i >= 0 else ()
+
+
+# IPv4 addresses are stored as unsigned 32-bit integers; 'L' is 8 bytes on LP64 platforms
+ADDRESS_TYPECODE = 'I'
+assert array(ADDRESS_TYPECODE).itemsize == 4, "array('%s') is not 32 bits wide" % ADDRESS_TYPECODE
+
+
+class CodeTable:
+    """Maps the few distinct values of a column to small integer codes."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
 class ServiceInformation:
-    # data structure for storing service detections
+    """Service detections stored column by column: addresses and ports in
+    typed arrays, protocol, status and service as small integer codes and
+    the banners as interned strings.
+
+    Rows are appended as they are read. Before the first lookup they are
+    sorted by address, protocol and port, keeping the last row read for
+    each, and an offset array indexes the rows of each host."""
+
     def __init__(self):
-        self.service_information = {}
-    
+        self.ips = array(ADDRESS_TYPECODE)
+        self.ports = array('H')
+        self.protos = array('B')
+        self.statuses = array('B')
+        self.services = array('H')
+        self.banners = []
+        self.proto_codes = CodeTable()
+        self.status_codes = CodeTable()
+        self.service_codes = CodeTable()
+        # the distinct addresses in order and where their rows start, built by index()
+        self.sorted_ips = None
+        self.host_starts = None
+
     def __repr__(self):
         result = "Service Information:\n"
-        for k in sorted(self.service_information.keys()):
-            result += "%s\n" % (self.service_information[k])
+        self.index()
+        for ip in self.sorted_ips:
+            result += "%s\n" % (self.get_service_info(ip))
         return result
 
+    def __len__(self):
+        self.index()
+        return len(self.ips)
+
     def read_gnmap(self, file_path):
         with open(file_path, "r") as fd:
-            lines = fd.readlines()
-        
-        for l in lines:
-            if "Ports" in l:
-                host_part, port_part = l.split("\t")
-                _, ip, _ = host_part.split(" ")
-                _, port_info = port_part.split("Ports: ")
-                port, status, proto, _, service, _, service_info, _ = port_info.split("/")
-                self.add_service_info(ip, proto, port, status, service, service_info)
+            for l in fd:
+                for status, proto, port, ip, service_info, service in parse_gnmap_line(l):
+                    self.add_service_info(ip, proto, port, status, service, service_info)
 
     def add_service_info(self, ip, proto, port, status, service, service_info):
         # use the integer representation of the ip address
-        # for fast dictionary lookups
-        ip = int(ipaddress.IPv4Address(ip))
-        port_str = "%s/%s" % (proto, port)
-        port_info = {port_str: [status, service, service_info]}
-        if ip not in self.service_information.keys():
-            self.service_information[ip] = port_info
-        else:
-            self.service_information[ip][port_str] = [status, service, service_info]
-    
+        # for fast lookups
+        self.ips.append(int.from_bytes(socket.inet_aton(ip), 'big'))
+        self.ports.append(int(port))
+        self.protos.append(self.proto_codes.code(proto))
+        self.statuses.append(self.status_codes.code(status))
+        self.services.append(self.service_codes.code(service))
+        self.banners.append(sys.intern(service_info))
+        self.sorted_ips = None
+
+    def merge(self, other):
+        """Appends the rows of another ServiceInformation, as if they were added after these."""
+        proto_map = [self.proto_codes.code(v) for v in other.proto_codes.values]
+        status_map = [self.status_codes.code(v) for v in other.status_codes.values]
+        service_map = [self.service_codes.code(v) for v in other.service_codes.values]
+        self.ips.extend(other.ips)
+        self.ports.extend(other.ports)
+        self.protos.extend(array('B', (proto_map[c] for c in other.protos)))
+        self.statuses.extend(array('B', (status_map[c] for c in other.statuses)))
+        self.services.extend(array('H', (service_map[c] for c in other.services)))
+        self.banners.extend(sys.intern(b) for b in other.banners)
+        self.sorted_ips = None
+
+    def index(self):
+        """Sorts the rows by address, protocol and port, keeps the last row added
+        for each, and indexes the first row of every address."""
+        if self.sorted_ips is not None:
+            return
+        protos = self.protos
+        ports = self.ports
+        ips = self.ips
+        # the sort is stable, so the last duplicate is the row added last
+        order = sorted(range(len(ips)), key=lambda i: (ips[i] << 24) | (protos[i] << 16) | ports[i])
+        keep = [i for n, i in enumerate(order)
+                if n + 1 == len(order) or
+                (ips[i], protos[i], ports[i]) != (ips[order[n + 1]], protos[order[n + 1]], ports[order[n + 1]])]
+        self.ips = array(ADDRESS_TYPECODE, (ips[i] for i in keep))
+        self.ports = array('H', (ports[i] for i in keep))
+        self.protos = array('B', (protos[i] for i in keep))
+        self.statuses = array('B', (self.statuses[i] for i in keep))
+        self.services = array('H', (self.services[i] for i in keep))
+        self.banners = [self.banners[i] for i in keep]
+        self.sorted_ips = array(ADDRESS_TYPECODE)
+        self.host_starts = array('L')
+        previous = None
+        for n, ip in enumerate(self.ips):
+            if ip != previous:
+                self.sorted_ips.append(ip)
+                self.host_starts.append(n)
+                previous = ip
+        self.host_starts.append(len(self.ips))
+
+    def host_rows(self, ip_int):
+        """returns the range of row numbers of an integer address"""
+        self.index()
+        i = bisect.bisect_left(self.sorted_ips, ip_int)
+        if i == len(self.sorted_ips) or self.sorted_ips[i] != ip_int:
+            return range(0)
+        return range(self.host_starts[i], self.host_starts[i + 1])
+
     def get_service_info(self, ip):
-        ip_int = int(ip)
-        result = None
-        if ip_int in self.service_information.keys():
-            result = self.service_information[ip_int]
-        
-        return result
+        """returns {'tcp/22': [status, service, service_info], } for an address, or None"""
+        rows = self.host_rows(int(ip))
+        if not rows:
+            return None
+        protos = self.proto_codes.values
+        statuses = self.status_codes.values
+        services = self.service_codes.values
+        return {"%s/%d" % (protos[self.protos[n]], self.ports[n]):
+                [statuses[self.statuses[n]], services[self.services[n]], self.banners[n]]
+                for n in rows}
+
+    def hosts_in_range(self, first, last):
+        """returns the integer addresses of the hosts with detections from first
+        to last inclusive, found with a binary search over the sorted addresses"""
+        self.index()
+        start = bisect.bisect_left(self.sorted_ips, int(first))
+        end = bisect.bisect_right(self.sorted_ips, int(last))
+        return self.sorted_ips[start:end]
 
     def get_all_service_info(self):
-        """returns a list of dicts, each dict having
+        """yields a dict for each detection, in address and port order,
         {ip, proto, port, status, service, service_info}"""
-        result = []
-
-        for k in self.service_information.keys():
-            ip = k
-            for p in self.service_information[k].keys():
-                proto, port = p.split("/")
-                service_list = self.service_information[k][p]
-                status = service_list[0]
-                service = service_list[1]
-                service_info = service_list[2]
-                result.append({
-                    'ip': str(ipaddress.IPv4Address(ip)), 
-                    'proto': proto, 
-                    'port': port, 
-                    'status': status, 
-                    'service': service,
-                    'service_info': service_info
-                    })
+        self.index()
+        protos = self.proto_codes.values
+        statuses = self.status_codes.values
+        services = self.service_codes.values
+        ip_string = None
+        previous = None
+        for n, ip in enumerate(self.ips):
+            if ip != previous:
+                ip_string = socket.inet_ntoa(ip.to_bytes(4, 'big'))
+                previous = ip
+            yield {
+                'ip': ip_string,
+                'proto': protos[self.protos[n]],
+                'port': str(self.ports[n]),
+                'status': statuses[self.statuses[n]],
+                'service': services[self.services[n]],
+                'service_info': self.banners[n]
+                }
 
-        return result
+
+# bytes of the masscan file parsed at a time by the NumPy path
+NUMPY_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def read_blocks(masscan_fd):
+    """yields the lines of a file in blocks of about NUMPY_BLOCK_SIZE bytes"""
+    while True:
+        lines = masscan_fd.readlines(NUMPY_BLOCK_SIZE)
+        if not lines:
+            return
+        yield "".join(lines).splitlines()
+
+
+def parse_ipv4_array(addresses):
+    """converts a list of dotted quad addresses to a uint32 array, a column of characters at a time"""
+    characters = np.array(addresses, dtype='S15')
+    characters = characters.view(np.uint8).reshape(len(addresses), 15)
+    result = np.zeros(len(addresses), dtype=np.uint32)
+    octet = np.zeros(len(addresses), dtype=np.uint32)
+    for column in characters.T:
+        digit = (column >= ord('0')) & (column <= ord('9'))
+        dot = column == ord('.')
+        octet = np.where(digit, octet * 10 + column - ord('0'), octet)
+        result = np.where(dot, (result << 8) | octet, result)
+        octet = np.where(dot, 0, octet)
+    return (result << 8) | octet
+
+
+def code_array(values, codes):
+    """returns the codes of values in a CodeTable as a uint8 array"""
+    unique, inverse = np.unique(np.array(values), return_inverse=True)
+    return np.array([codes.code(v) for v in unique.tolist()], dtype=np.uint8)[inverse]
+
+
+def aggregate_numpy(masscan_fd, target_index, keep_rows, metrics):
+    """The NumPy version of the masscan file loop in main(): parses the open lines a block
+    at a time into arrays, maps the addresses to target index segments with searchsorted
+    and adds the unique (segment, protocol, port) combinations to the target reports.
+    With keep_rows, returns the detail rows main() would have collected."""
+    starts = np.array(target_index.starts, dtype=np.int64)
+    proto_codes = CodeTable()
+    status_codes = CodeTable()
+    keys = []
+    blocks = []
+    for lines in read_blocks(masscan_fd):
+        metrics.inc("lines", len(lines))
+        open_lines = [l for l in lines if 'open' in l]
+        metrics.inc("open", len(open_lines))
+        metrics.update()
+        if not open_lines:
+            continue
+        tokens = " ".join(open_lines).split(" ")
+        if len(tokens) != 5 * len(open_lines):
+            # fail on the malformed line like the line by line parser
+            for l in open_lines:
+                port_status, protocol, port, destination, _ = l.split(" ")
+        ips = parse_ipv4_array(tokens[3::5])
+        ports = np.array(tokens[2::5]).astype(np.uint32)
+        protos = code_array(tokens[1::5], proto_codes)
+        segments = np.searchsorted(starts, ips, side='right') - 1
+        key = (segments << 24) | (protos.astype(np.int64) << 16) | ports
+        keys.append(np.unique(key[segments >= 0]))
+        if keep_rows:
+            blocks.append((ips, ports.astype(np.uint16), protos, code_array(tokens[0::5], status_codes)))
+
+    if keys:
+        for key in np.unique(np.concatenate(keys)).tolist():
+            protocol = proto_codes.values[(key >> 16) & 0xff]
+            for m in target_index.segments[key >> 24]:
+                m.add_port(protocol, key & 0xffff)
+    return numpy_rows(blocks, proto_codes, status_codes) if keep_rows else []
+
+
+def numpy_rows(blocks, proto_codes, status_codes):
+    """yields the detail rows of the blocks parsed by aggregate_numpy"""
+    for ips, ports, protos, statuses in blocks:
+        for ip, port, proto, status in zip(ips.tolist(), ports.tolist(), protos.tolist(), statuses.tolist()):
+            protocol = proto_codes.values[proto]
+            yield {
+                'ip': socket.inet_ntoa(ip.to_bytes(4, 'big')),
+                'proto': protocol,
+                'port': str(port),
+                'status': status_codes.values[status],
+                'service': SERVICE_DB.get('%s/%d' % (protocol, port), ""),
+                'service_info': ""
+            }
+
+
+def read_gnmap_file(file_path):
+    """Reads one greppable output file into its own ServiceInformation,
+    returns it with the size of the file. Runs in the worker processes."""
+    service_info = ServiceInformation()
+    service_info.read_gnmap(file_path)
+    return service_info, os.path.getsize(file_path)
+
+
+def load_service_information(service_detect_dir, jobs, metrics):
+    """Reads every .gnmap file of a service detection directory into one
+    ServiceInformation, with a pool of jobs processes parsing the files.
+    The files are merged in name order, so a later file's detection of a
+    port replaces an earlier one like when they are read one by one."""
+    paths = [os.path.join(service_detect_dir, f) for f in sorted(os.listdir(service_detect_dir))
+             if f.endswith(".gnmap")]
+    service_info = ServiceInformation()
+    start = time.monotonic()
+    total_bytes = 0
+    progress, total = metrics.progress, metrics.total
+    metrics.progress, metrics.total = "gnmap_files", len(paths)
+    if jobs > 1 and len(paths) > 1:
+        with multiprocessing.Pool(processes=min(jobs, len(paths))) as pool:
+            for partial, num_bytes in pool.imap(read_gnmap_file, paths):
+                service_info.merge(partial)
+                total_bytes += num_bytes
+                metrics.inc("gnmap_files")
+                metrics.inc("gnmap_bytes", num_bytes)
+                metrics.update()
+    else:
+        jobs = 1
+        for path in paths:
+            service_info.read_gnmap(path)
+            num_bytes = os.path.getsize(path)
+            total_bytes += num_bytes
+            metrics.inc("gnmap_files")
+            metrics.inc("gnmap_bytes", num_bytes)
+            metrics.update()
+    metrics.progress, metrics.total = progress, total
+    print("[*] read %d service detections from %d files (%.1f MB) in %.2f seconds with %d process%s" %
+          (len(service_info), len(paths), total_bytes / 1e6,
+           time.monotonic() - start, jobs, "es" if jobs > 1 else ""), file=sys.stderr)
+    return service_info
 
 
 def main():
@@ -1299,6 +1573,12 @@ def main():
     parser.add_argument("-s", nargs="?", help="service detection directory")
     parser.add_argument("-c", nargs="?", help="csv summary output file")
     parser.add_argument("-C", nargs="?", help="csv detail output file")
+    parser.add_argument("--numpy", action="store_true",
+                        help="parse the masscan file in blocks with NumPy, if it is installed")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="processes reading the service detection directory")
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     parser.add_argument("target_file", nargs=1, help="targets text file")
     parser.add_argument("masscan_file", nargs=1, help="masscan file")
     args = parser.parse_args()
@@ -1308,61 +1588,70 @@ def main():
     service_detect_dir = args.s
     csv_output = args.c
     csv_detail_output = args.C
+    profiler = profiler_from_args("masscan_report", args)
+    metrics = metrics_from_args("masscan_report", args, progress="lines", profiler=profiler)
 
-    # open the targets file
-    with open(targets_file, 'r') as targets_fd:
-        lines = targets_fd.read().split('\n')
+    with metrics.phase("parse"):
+        # open the targets file
+        with open(targets_file, 'r') as targets_fd:
+            lines = targets_fd.read().split('\n')
 
-    # add each network to the list of target_nets
-    while '' in lines:
-        # remove blank lines
-        lines.remove('')
+        # add each network to the list of target_nets
+        while '' in lines:
+            # remove blank lines
+            lines.remove('')
 
-    # add all networks to the list of target_nets
-    for l in lines:
-        l = l.strip()
-        if '#' in l[0]:
-            # comment
-            continue
-        elif '/' in l:
-            # network specification
-            network = ipaddress.IPv4Network(l, strict=False)
-        else:
-            network = ipaddress.IPv4Network(l + "/32", strict=False)
-        
-        if network not in target_nets:
-            target_nets.append(network)
-    
-    # gather service information
-    service_info = None
-    if service_detect_dir is not None:
-        service_info = ServiceInformation()
-        for f in os.listdir(service_detect_dir):
-            if f.endswith(".gnmap"):
-                file_path = os.path.join(service_detect_dir, f)
-                service_info.read_gnmap(file_path)
+        # add all networks to the list of target_nets
+        for l in lines:
+            l = l.strip()
+            if '#' in l[0]:
+                # comment
+                continue
+            elif '/' in l:
+                # network specification
+                network = ipaddress.IPv4Network(l, strict=False)
+            else:
+                network = ipaddress.IPv4Network(l + "/32", strict=False)
+            
+            if network not in target_nets:
+                target_nets.append(network)
+
+        # gather service information
+        service_info = None
+        if service_detect_dir is not None:
+            service_info = load_service_information(service_detect_dir, args.jobs, metrics)
 
     print("target nets:")
-    for t in target_nets:
-        r = MasscanTargetReport(t, service_info)
-        masscan_reports.append(r)
-        print(str(t))
+    with metrics.phase("index"):
+        for t in target_nets:
+            r = MasscanTargetReport(t, service_info)
+            masscan_reports.append(r)
+            print(str(t))
+        target_index = TargetIndex(masscan_reports)
+
+    if args.numpy and np is None:
+        print("[-] numpy is not installed, parsing the masscan file line by line", file=sys.stderr)
 
     # read and process the masscan input file
     service_info_list = []
-    with open(masscan_results_file) as masscan_fd:
-        masscan_lines = masscan_fd.read().splitlines()
-        total_lines = len(masscan_lines)
+    with metrics.phase("aggregate"), open(masscan_results_file) as masscan_fd:
+        if args.numpy and np is not None:
+            masscan_lines = []
+            service_info_list = aggregate_numpy(masscan_fd, target_index,
+                                                service_info is None and csv_detail_output is not None, metrics)
+        else:
+            masscan_lines = masscan_fd.read().splitlines()
+        metrics.total = len(masscan_lines)
         for i, line in enumerate(masscan_lines):
-            if i % 1000 == 0:
-                print("[*] processed %i/%i lines" % (i, total_lines))
+            metrics.inc("lines")
+            metrics.update()
             if 'open' in line:
+                metrics.inc("open")
                 port_status, protocol, port, destination, _ = line.split(" ")
 
                 destination = ipaddress.IPv4Address(destination)
-                for m in masscan_reports:
-                    if m.contains(destination):
-                        m.add_port(protocol, port)
+                for m in target_index.lookup(destination):
+                    m.add_port(protocol, port)
 
                 if service_info is None:
                     # add to service_info_dict for later use
@@ -1383,34 +1672,37 @@ def main():
 
     # print each masscan report after sorting, primarily by source, secondarily by target
     s = sorted(masscan_reports, key=attrgetter('target_network'))
-    for r in s:
-        if r.has_open_ports():
-            print(r)
-    
-    # output to CSV if desired
-    if csv_output is not None:
-        csv_fd = open(csv_output, 'w', newline='')
-        field_names = ['target', 'source', 'open_ports_tcp', 'open_ports_udp']
-        csv_writer = csv.DictWriter(csv_fd, fieldnames=field_names)
-        csv_writer.writeheader()
+    with metrics.phase("write"):
         for r in s:
             if r.has_open_ports():
-                data = r.dictionary()
-                data['source'] = os.path.basename(masscan_results_file)
-                csv_writer.writerow(data)
-        csv_fd.close()
-
-    if csv_detail_output is not None:
-        if service_info is not None:
-            service_info_list = service_info.get_all_service_info()
-        
-        csv_fd = open(csv_detail_output, 'w', newline='')
-        field_names = ['ip', 'proto', 'port', 'status', 'service', 'service_info']
-        csv_writer = csv.DictWriter(csv_fd, fieldnames=field_names)
-        csv_writer.writeheader()
-        for s in service_info_list:
-            csv_writer.writerow(s)
-        csv_fd.close()
+                print(r)
+    
+        # output to CSV if desired
+        if csv_output is not None:
+            csv_fd = open(csv_output, 'w', newline='')
+            field_names = ['target', 'source', 'open_ports_tcp', 'open_ports_udp']
+            csv_writer = csv.DictWriter(csv_fd, fieldnames=field_names)
+            csv_writer.writeheader()
+            for r in s:
+                if r.has_open_ports():
+                    data = r.dictionary()
+                    data['source'] = os.path.basename(masscan_results_file)
+                    csv_writer.writerow(data)
+            csv_fd.close()
+
+        if csv_detail_output is not None:
+            if service_info is not None:
+                service_info_list = service_info.get_all_service_info()
+            
+            csv_fd = open(csv_detail_output, 'w', newline='')
+            field_names = ['ip', 'proto', 'port', 'status', 'service', 'service_info']
+            csv_writer = csv.DictWriter(csv_fd, fieldnames=field_names)
+            csv_writer.writeheader()
+            csv_writer.writerows(service_info_list)
+            csv_fd.close()
+
+    metrics.finish(args.metrics_json)
+    profiler.finish()
 
 
 def print_help():
@@ -1419,7 +1711,9 @@ def print_help():
 Optional arguments:
    -s <service detection directory>
    -c <csv summary output file>
-   -C <csv detail output file>""")
+   -C <csv detail output file>
+   -j <processes reading the service detection directory>
+   --numpy  parse the masscan file in blocks with NumPy""")
 
 
 if __name__ == "__main__":
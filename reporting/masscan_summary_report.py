@@ -4,78 +4,81 @@
 # Given a directory, it will assume every csv file
 # is a masscan report and process it.
 #
-# Usage: masscan_summary_report.py <directory> <output file>
+# Usage: masscan_summary_report.py [--profile <file>] [--profile-cprofile <file>] <directory> <output file>
 #
 
+import argparse
 import csv
 import ipaddress
 import os
 import sys
 
-
-def get_matching_index(data, target, open_tcp, open_udp):
-    """returns the index in data that matches all three variables"""
-    index = None
-    for i, d in enumerate(data):
-        if d['target'] == target and d['open_tcp'] == open_tcp and d['open_udp'] == open_udp:
-            index = i
-            break
-    
-    return index
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from scan_profiling import add_profile_arguments, profiler_from_args
 
 
 def main():
     """main function"""
-    if len(sys.argv) != 3:
-        print("Usage: masscan_summary_report.py <directory> <output file>")
-        sys.exit(1)
-    
-    directory = sys.argv[1]
-    output_file = sys.argv[2]
+    parser = argparse.ArgumentParser(description="summarizes all the masscan reports in a directory")
+    add_profile_arguments(parser)
+    parser.add_argument("directory", help="directory of masscan_report.py CSV files")
+    parser.add_argument("output_file", help="summary CSV file to write")
+    args = parser.parse_args()
+
+    directory = args.directory
+    output_file = args.output_file
+    profiler = profiler_from_args("masscan_summary_report", args)
     if not os.path.isdir(directory):
         print("[-] path provided is not a directory")
         sys.exit(1)
 
     print("[*] summarizing %s" % directory)
-    # data = [{'target': network, 'open_tcp': ports, 'open_udp': ports, 'sources': [source1, source2, ...]},
-    # ]
-    data = []
-    for f in os.listdir(directory):
-        if f.endswith(".csv"):
-            path = os.path.join(directory, f)
-            print('[*] processing %s' % path)
-            with open(path, 'r', newline="") as csv_fd:
-                reader = csv.reader(csv_fd, dialect='excel')
-                header = next(reader)
-                for row in reader:
-                    target = row[0]
-                    source = row[1]
-                    open_tcp = row[2]
-                    open_udp = row[3]
-                    index = get_matching_index(data, target, open_tcp, open_udp)
-                    if index is not None:
-                        data[index]['sources'].append(source)
-                    else:
-                        data.append({
-                            'target': target,
-                            'open_tcp': open_tcp,
-                            'open_udp': open_udp,
-                            'sources': [source]
-                        })
-    
-    # data cleanup
-    for d in data:
-        sources = "; ".join(d['sources'])
-        d['sources'] = sources
-        d['network_id'] = int(ipaddress.IPv4Network(d['target']).network_address)
+    # data = {(target, open_tcp, open_udp): {'target': network, 'open_tcp': ports, 'open_udp': ports,
+    #                                        'sources': [source1, source2, ...]},
+    # }
+    # dicts keep insertion order, so rows are written in the order they were first seen
+    data = {}
+    network_ids = {}
+    with profiler.stage("aggregate"):
+        for f in os.listdir(directory):
+            if f.endswith(".csv"):
+                path = os.path.join(directory, f)
+                print('[*] processing %s' % path)
+                with open(path, 'r', newline="") as csv_fd:
+                    reader = csv.reader(csv_fd, dialect='excel')
+                    header = next(reader)
+                    for row in reader:
+                        target = row[0]
+                        source = row[1]
+                        open_tcp = row[2]
+                        open_udp = row[3]
+                        d = data.get((target, open_tcp, open_udp))
+                        if d is not None:
+                            d['sources'].append(source)
+                        else:
+                            data[(target, open_tcp, open_udp)] = {
+                                'target': target,
+                                'open_tcp': open_tcp,
+                                'open_udp': open_udp,
+                                'sources': [source]
+                            }
+
+        # data cleanup
+        for d in data.values():
+            sources = "; ".join(d['sources'])
+            d['sources'] = sources
+            if d['target'] not in network_ids:
+                network_ids[d['target']] = int(ipaddress.IPv4Network(d['target']).network_address)
+            d['network_id'] = network_ids[d['target']]
 
     # write the summary report
     field_names = ['network_id', 'target', 'sources', 'open_tcp', 'open_udp']
-    with open(output_file, 'w', newline="") as csv_fd:
+    with profiler.stage("write"), open(output_file, 'w', newline="") as csv_fd:
         writer = csv.DictWriter(csv_fd, fieldnames=field_names)
         writer.writeheader()
-        for d in data:
-            writer.writerow(d)
+        writer.writerows(data.values())
+
+    profiler.finish()
 
 
 if __name__ == "__main__":
@@ -10,11 +10,17 @@
 #   input file/directory:     can be a single file or a directory, if it is a directory
 #                             the directory contents will be searched for files with the
 #                             .gnmap extension
+#   --profile <file>:         write per-stage timings and peak memory as JSON
+#   --profile-cprofile <file>: write cProfile stats
 
+import argparse
 import csv
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from scan_profiling import add_profile_arguments, profiler_from_args
+
 
 class NmapHostStatus:
     
@@ -71,21 +77,20 @@ class NmapHostStatus:
 
 def main():
     """main function"""
-    # set options
-    overwrite = False
-
     # get arguments
-    if len(sys.argv) < 2:
-        print("[-] Error: invalid number of arguments")
-        print_help()
-        sys.exit(1)
-    if sys.argv[1] == '--overwrite':
-        overwrite = True
-        input_path = sys.argv[2]
-        output_file = sys.argv[3]
-    else:
-        input_path = sys.argv[1]
-        output_file = sys.argv[2]
+    parser = argparse.ArgumentParser(description="turns nmap greppable output into a CSV file")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="overwrite the output file rather than append to it")
+    add_profile_arguments(parser)
+    parser.add_argument("input_path", help="a .gnmap file or a directory of .gnmap files")
+    parser.add_argument("output_file", help="CSV file to write")
+    args = parser.parse_args()
+
+    # set options
+    overwrite = args.overwrite
+    input_path = args.input_path
+    output_file = args.output_file
+    profiler = profiler_from_args("nmap-grep-csv", args)
 
     # check if the input provided is a directory or a single file
     if os.path.isdir(input_path):
@@ -108,65 +113,56 @@ def main():
         else:
             out_file = open(output_file, 'a', newline='')
 
-        # get contents of the input file
-        file_contents = in_file.read()
-        in_file.close()
-        lines = file_contents.split('\n')
-
-        # gather the data from the file
-        data = []
-        # CSV fields 
-        # host, status, port, port_status,protocol,name
-        found_host_section = False
-        for num, line in enumerate(lines):
-            if 'Host: ' in line and 'Status: ' in line:
-                _, host, _, status = line.split(' ')
-                host_data = NmapHostStatus(host, status)
-                found_host_section = True
-            elif 'Host: ' in line and 'Ports: ' in line:
-                sections = line.split('\t')
-
-                if not found_host_section:
-                    _, host, _ = sections[0].split(' ')
-                    host_data = NmapHostStatus(host, 'up')
-
-                parts = sections[1].split(':', maxsplit=1)
-                ports = parts[1].split("/, ")
-                for port_info in ports:
-                    try:
-                        host_data.add_port_gnmap(port_info)
-                    except IndexError:
-                        print("IndexError with line %d [%s]" % (num, line))
-
-                        sys.exit(1)
-                data.append(host_data)
-                found_host_section = False
-        
-        # now write the data to the output file
-        fieldnames = ['source', 'destination', 'status', 'port', 'port_status', 'protocol', 'name', 'service']
-        nmap_writer = csv.DictWriter(out_file, fieldnames=fieldnames)
-        out_file_size = os.fstat(out_file.fileno()).st_size
-        if overwrite or out_file_size == 0:
-            nmap_writer.writeheader()
-        for d in data:
-            for row in d.csv_list(filename):
-                nmap_writer.writerow(row)
+        with profiler.stage("parse"):
+            # get contents of the input file
+            file_contents = in_file.read()
+            in_file.close()
+            lines = file_contents.split('\n')
+
+            # gather the data from the file
+            data = []
+            # CSV fields 
+            # host, status, port, port_status,protocol,name
+            found_host_section = False
+            for num, line in enumerate(lines):
+                if 'Host: ' in line and 'Status: ' in line:
+                    _, host, _, status = line.split(' ')
+                    host_data = NmapHostStatus(host, status)
+                    found_host_section = True
+                elif 'Host: ' in line and 'Ports: ' in line:
+                    sections = line.split('\t')
+
+                    if not found_host_section:
+                        _, host, _ = sections[0].split(' ')
+                        host_data = NmapHostStatus(host, 'up')
+
+                    parts = sections[1].split(':', maxsplit=1)
+                    ports = parts[1].split("/, ")
+                    for port_info in ports:
+                        try:
+                            host_data.add_port_gnmap(port_info)
+                        except IndexError:
+                            print("IndexError with line %d [%s]" % (num, line))
+
+                            sys.exit(1)
+                    data.append(host_data)
+                    found_host_section = False
+
+        with profiler.stage("write"):
+            # now write the data to the output file
+            fieldnames = ['source', 'destination', 'status', 'port', 'port_status', 'protocol', 'name', 'service']
+            nmap_writer = csv.DictWriter(out_file, fieldnames=fieldnames)
+            out_file_size = os.fstat(out_file.fileno()).st_size
+            if overwrite or out_file_size == 0:
+                nmap_writer.writeheader()
+            for d in data:
+                for row in d.csv_list(filename):
+                    nmap_writer.writerow(row)
 
         out_file.close()
 
+    profiler.finish()
 
-def print_help():
-    """prints a help message"""
-    print("""Usage:
-nmap-grep-csv.py [--overwrite] <input file/directory> <output file>
-  --overwrite:              by default, the output file is appended to, use this switch to 
-                            overwrite the output file rather than append to it)
-  
-  input file/directory:     can be a single file or a directory, if it is a directory
-                            the directory contents will be searched for files with the
-                            .gnmap extension""")
-
- 
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,64 +3,321 @@
 """
 Takes a scan file and creates a
 list of hosts accessible for each unique port
-in the results file. Supports nmap greppable
-output and masscan list output.
+in the results file. Supports nmap greppable and
+XML output and masscan list, binary, JSON and XML
+output (see scan_readers.py). Each host file is
+sorted numerically and lists every host once.
 
-Usage: scan_host_list.py <scan file> <output directory>
+Usage: scan_host_list.py [-j <jobs>] <scan file> <output directory>
     If the output directory exists, it will not create it.
+    With -j greater than 1 a masscan list or nmap greppable
+    file is split into newline-aligned chunks that are
+    parsed in parallel.
+
+Follow mode: scan_host_list.py --follow <scan file> <output directory>
+    Tails a masscan list or nmap greppable file while the
+    scan is running. New hosts are appended to the host
+    files as they appear and are grouped into batches in
+    <output directory>/batches/<proto>_<port>_<n>.txt,
+    written once --batch-size hosts or --batch-interval
+    seconds have accumulated, so probing can start before
+    the scan finishes. --on-ready runs a command for every
+    batch. Stops at the scanner's end line.
 """
 
 import argparse
+import collections
+import ctypes
+import ctypes.util
+import mmap
+import multiprocessing
 import os
+import select
+import shlex
+import signal
+import subprocess
+import time
 
+from host_writer import HostFileWriter, PortHostSets, host_key, key_host
+from scan_readers import LINE_FORMATS, READ_SIZE, detect_format, parse_text_line, read_records
+from scan_metrics import add_metrics_arguments, metrics_from_args
+from scan_profiling import add_profile_arguments, profiler_from_args
 
-def host_output(output_directory, proto, port, host):
-    """Write a host to an output file."""
-    output_file = os.path.join(output_directory, "%s_%s.txt" % (proto, port))
 
-    # write the host to the output file
-    with open(output_file, 'a') as host_fd:
-        host_fd.write("%s\n" % host)
+def parse_records(line, file_type):
+    """Returns a list of (proto, port, host) for the open ports on a scan file line."""
+    return [(proto, port, host) for state, proto, port, host, _ in parse_text_line(line, file_type)
+            if state == "open"]
 
 
-def parse_line(line, output_directory, file_type, debug):
-    """Parse a scan file line."""
-    if line[0] == "#":
-        return None
+def chunk_offsets(scan_file, num_chunks):
+    """Splits scan_file into at most num_chunks byte ranges, every range
+    starts at the beginning of a line and ends after a newline (or at EOF)."""
+    size = os.path.getsize(scan_file)
+    if size == 0:
+        return []
 
-    if file_type == "masscan":
-        if debug:
-            print(f"DEBUG masscan line = {line}")
-        state, proto, port, host, ident = line.split()
-        host_output(output_directory, proto, port, host)
-    elif file_type == "nmap":
-        if debug:
-            print(f"DEBUG nmap line = {line}")
-        # Ignore these lines:
-        # Host: 10.1.1.1 ()   Status: Up
-        if "Status:" not in line:
-            # Host: 10.1.1.1 ()   Ports: 21/filtered/tcp//ftp///, 80/open/tcp//http///,
-            # 53/open|filtered/udp//domain///, 137/open/udp//netbios-ns///  Ignored State: filtered (195)
-            host_info, port_info = line.split("Ports:")
-            host = host_info.strip().split(' ')[1]
-
-            # get the port information
-            port_info = port_info.strip()
-            if "Ignored State" in port_info:
-                port_info, _ = port_info.split('Ignored State:')
-            port_info = port_info.strip()
-            port_list = port_info.split(',')
-            port_list = [ x.strip() for x in port_list ]
-            for p in port_list:
-                try:
-                    port, state, proto, _, desc, _, _, _ = p.split('/')
-                    if state == "open":
-                        host_output(output_directory, proto, port, host)
-                except ValueError:
+    boundaries = [0]
+    with open(scan_file, 'rb') as scan_fd, mmap.mmap(scan_fd.fileno(), 0, access=mmap.ACCESS_READ) as scan_map:
+        for i in range(1, num_chunks):
+            # move the split point forward to just after the next newline
+            newline = scan_map.find(b"\n", max(size * i // num_chunks - 1, boundaries[-1]))
+            if newline == -1:
+                break
+            if newline + 1 > boundaries[-1]:
+                boundaries.append(newline + 1)
+    if boundaries[-1] != size:
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_chunk(args):
+    """Parses the lines in the byte range [start, end) of a scan file, returns
+    ({(proto, port): {host key, ...}}, number of lines, number of bytes)."""
+    scan_file, start, end, file_type, exclude_ports = args
+    port_hosts = {}
+    num_lines = 0
+    with open(scan_file, 'rb') as scan_fd, mmap.mmap(scan_fd.fileno(), 0, access=mmap.ACCESS_READ) as scan_map:
+        position = start
+        while position < end:
+            newline = scan_map.find(b"\n", position, end)
+            line_end = end if newline == -1 else newline + 1
+            line = scan_map[position:line_end].decode('utf-8', errors='replace')
+            position = line_end
+            num_lines += 1
+            for proto, port, host in parse_records(line, file_type):
+                if port in exclude_ports:
                     continue
+                key = (proto, port)
+                if key not in port_hosts:
+                    port_hosts[key] = set()
+                port_hosts[key].add(host_key(host))
+    return port_hosts, num_lines, end - start
+
+
+def parse_parallel(scan_file, file_type, jobs, host_sets, exclude_ports=(), metrics=None):
+    """Parses scan_file in newline-aligned chunks using a pool of jobs processes
+    and merges the hosts of every chunk into host_sets."""
+    # several chunks per worker keeps the pool busy when chunks parse at different speeds
+    offsets = chunk_offsets(scan_file, jobs * 4)
+    chunk_args = [(scan_file, start, end, file_type, set(exclude_ports)) for start, end in offsets]
+    with multiprocessing.Pool(processes=jobs) as pool:
+        for chunk_hosts, num_lines, num_bytes in pool.imap_unordered(parse_chunk, chunk_args):
+            for key, hosts in chunk_hosts.items():
+                host_sets.update(key, hosts)
+            if metrics is not None:
+                metrics.inc("bytes", num_bytes)
+                metrics.inc("lines", num_lines)
+                metrics.inc("open", sum(len(x) for x in chunk_hosts.values()))
+                metrics.update()
+
+
+class FileWatcher:
+    """Waits for a file to be written to, using inotify on Linux and
+    falling back to polling where inotify is not available."""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+
+    def __init__(self, path, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                mask = self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_DELETE_SELF | self.IN_MOVE_SELF
+                if libc.inotify_add_watch(fd, os.fsencode(path), mask) >= 0:
+                    self.fd = fd
+                else:
+                    os.close(fd)
+        except (OSError, AttributeError):
+            self.fd = None
+
+    def wait(self, timeout):
+        """Returns when the file changes or after timeout seconds."""
+        if self.fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # drain the queued events, only the wake up matters
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ReadyBatches:
+    """Collects newly found hosts per port and writes them to
+    <batch directory>/<proto>_<port>_<sequence>.txt once a batch
+    has batch_size hosts or its oldest host is batch_interval
+    seconds old. Batch files are renamed into place, so every file
+    in the batch directory is complete and ready to be probed.
+    An optional command is run for every ready batch."""
+
+    def __init__(self, batch_directory, batch_size, batch_interval, on_ready=None, on_ready_jobs=4):
+        self.batch_directory = batch_directory
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.on_ready = on_ready
+        self.on_ready_jobs = max(1, on_ready_jobs)
+        self.pending = {}
+        self.sequence = {}
+        self.commands = collections.deque()
+        self.running = []
+        os.makedirs(batch_directory, exist_ok=True)
+
+    def add(self, key, host):
+        if key not in self.pending:
+            self.pending[key] = (time.monotonic(), [])
+        hosts = self.pending[key][1]
+        hosts.append(host)
+        if len(hosts) >= self.batch_size:
+            self.ready(key)
+
+    def check(self):
+        """Marks the batches that have waited batch_interval seconds as ready."""
+        now = time.monotonic()
+        for key in [k for k, (started, _) in self.pending.items() if now - started >= self.batch_interval]:
+            self.ready(key)
+        self.run_commands()
+
+    def ready(self, key):
+        _, hosts = self.pending.pop(key)
+        proto, port = key
+        self.sequence[key] = self.sequence.get(key, 0) + 1
+        batch_file = os.path.join(self.batch_directory, "%s_%s_%04d.txt" % (proto, port, self.sequence[key]))
+        with open(batch_file + ".tmp", 'w') as batch_fd:
+            batch_fd.writelines("%s\n" % h for h in hosts)
+        os.replace(batch_file + ".tmp", batch_file)
+        print("[*] batch ready: %s (%d hosts)" % (batch_file, len(hosts)))
+        if self.on_ready is not None:
+            command = [x.format(file=batch_file, proto=proto, port=port) for x in shlex.split(self.on_ready)]
+            self.commands.append(command)
+        self.run_commands()
 
+    def run_commands(self):
+        """Reaps finished commands and starts queued ones up to on_ready_jobs."""
+        self.running = [p for p in self.running if p.poll() is None]
+        while self.commands and len(self.running) < self.on_ready_jobs:
+            command = self.commands.popleft()
+            print("[*] running %s" % " ".join(command))
+            self.running.append(subprocess.Popen(command))
 
-    return True
+    def finish(self):
+        """Marks every pending batch as ready and waits for the commands to finish."""
+        for key in list(self.pending):
+            self.ready(key)
+        while self.commands or self.running:
+            self.run_commands()
+            if self.running:
+                self.running[0].wait()
+
+
+def is_end_line(line, file_type):
+    """returns True for the line a scanner writes when it has finished"""
+    if file_type == "masscan":
+        return line.startswith("# end")
+    return line.startswith("# Nmap done")
+
+
+def follow_scan_file(scan_file, output_directory, batches, idle_timeout, poll_interval, metrics):
+    """Tails a growing masscan list or nmap greppable file, appending new unique
+    hosts to the per-port host files as they appear and handing them to batches.
+    Returns when the scanner writes its end line, after idle_timeout seconds
+    without new data (if set), or on Ctrl-C or SIGTERM."""
+    seen = {}
+    file_type = None
+    partial = ""
+    finished = False
+
+    def add_line(line, writer):
+        for proto, port, host in parse_records(line, file_type):
+            key = (proto, port)
+            h = host_key(host)
+            hosts = seen.get(key)
+            if hosts is None:
+                hosts = seen[key] = set()
+            if h not in hosts:
+                hosts.add(h)
+                writer.write(proto, port, host)
+                batches.add(key, host)
+                metrics.inc("new_hosts")
+        metrics.inc("lines")
+
+    def add_data(data, writer):
+        nonlocal file_type, partial, finished
+        lines = (partial + data).split("\n")
+        # the last line may still be being written
+        partial = lines.pop()
+        for line in lines:
+            if file_type is None and line.strip():
+                if line.startswith("#masscan"):
+                    file_type = "masscan"
+                elif line.startswith("# Nmap"):
+                    file_type = "nmap"
+                else:
+                    assert False, "follow mode supports masscan list and nmap greppable output"
+            if file_type is None:
+                continue
+            if is_end_line(line, file_type):
+                finished = True
+            add_line(line, writer)
+        # make the new hosts visible to anything reading the host files
+        writer.flush()
+
+    print("[*] waiting for %s" % scan_file)
+    while not os.path.exists(scan_file):
+        time.sleep(poll_interval)
+
+    watcher = FileWatcher(scan_file, poll_interval)
+    last_data = time.monotonic()
+    with open(scan_file, 'r', errors='replace') as scan_fd, HostFileWriter(output_directory) as writer:
+        try:
+            while not finished:
+                data = scan_fd.read(READ_SIZE)
+                if data:
+                    last_data = time.monotonic()
+                    add_data(data, writer)
+                elif os.path.getsize(scan_file) < scan_fd.tell():
+                    print("[-] %s was truncated, reading from the start" % scan_file)
+                    scan_fd.seek(0)
+                    partial = ""
+                elif idle_timeout and time.monotonic() - last_data >= idle_timeout:
+                    print("[*] no new data for %d seconds, stopping" % idle_timeout)
+                    break
+                else:
+                    watcher.wait(min(batches.batch_interval, poll_interval))
+                batches.check()
+                metrics.set("pending_batches", len(batches.pending))
+                metrics.set("running_commands", len(batches.running))
+                metrics.update()
+        except KeyboardInterrupt:
+            print("[*] interrupted, reading the rest of %s" % scan_file)
+        finally:
+            watcher.close()
+        # whatever was written after the last read, including an unterminated last line
+        add_data(scan_fd.read() + "\n", writer)
+
+    batches.finish()
+
+    # rewrite the host files in the same sorted order a normal run produces
+    for (proto, port), hosts in seen.items():
+        host_file = os.path.join(output_directory, "%s_%s.txt" % (proto, port))
+        with open(host_file + ".tmp", 'w') as host_fd:
+            host_fd.writelines("%s\n" % key_host(h) for h in sorted(h for h in hosts if not isinstance(h, str)))
+            host_fd.writelines("%s\n" % h for h in sorted(h for h in hosts if isinstance(h, str)))
+        os.replace(host_file + ".tmp", host_file)
 
 
 def main():
@@ -69,6 +326,29 @@ def main():
 
     parser = argparse.ArgumentParser(description='Creates a list of hosts per protocol/port from a scan file.')
     parser.add_argument('--debug', '-d', action='store_true', help="Enable debug output")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="Number of processes to parse the scan file with, 1 parses serially")
+    parser.add_argument('--memory-budget', type=int, default=512,
+                        help="MB of hosts to hold in memory before spilling sorted runs to disk")
+    parser.add_argument('--max-open-files', type=int, default=256,
+                        help="Number of per-port output files kept open at once")
+    follow_group = parser.add_argument_group('follow mode')
+    follow_group.add_argument('--follow', '-f', action='store_true',
+                              help="Tail a scan file that is still being written and update the host files as it grows")
+    follow_group.add_argument('--batch-size', type=int, default=256,
+                              help="Hosts per port in a ready batch")
+    follow_group.add_argument('--batch-interval', type=float, default=30.0,
+                              help="Seconds after which a partial batch is marked ready")
+    follow_group.add_argument('--idle-timeout', type=float, default=0,
+                              help="Stop following after this many seconds without new data, 0 waits for the end line")
+    follow_group.add_argument('--poll-interval', type=float, default=1.0,
+                              help="Seconds between checks when inotify is not available")
+    follow_group.add_argument('--on-ready', required=False,
+                              help="Command to run for every ready batch, {file}, {proto} and {port} are replaced")
+    follow_group.add_argument('--on-ready-jobs', type=int, default=4,
+                              help="Number of --on-ready commands to run at once")
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     parser.add_argument('scan_file', help='Scan file to parse.')
     parser.add_argument('output_directory', help='Directory to put output files into, must not exist.')
     args = parser.parse_args()
@@ -77,7 +357,7 @@ def main():
     output_directory = args.output_directory
 
     # test arguments
-    assert os.path.isfile(scan_file)
+    assert args.follow or os.path.isfile(scan_file)
     assert not os.path.isdir(output_directory)
     if args.debug is not None:
         debug = args.debug
@@ -85,17 +365,42 @@ def main():
     # make the directory
     os.mkdir(output_directory, 0o755)
 
-    with open(scan_file, 'r') as scan_fd:
-        for i, line in enumerate(scan_fd):
-            # read the header line to determine the file type
-            if i == 0:
-                if "#masscan" in line:
-                    file_type = "masscan"
-                elif "# Nmap" in line:
-                    file_type = "nmap"
-                else:
-                    assert False, "file type unknown"
-            parse_line(line, output_directory, file_type, debug)
+    profiler = profiler_from_args("scan_host_list", args)
+    if args.follow:
+        # a follower started in the background by a script ignores SIGINT, let it be stopped with SIGTERM
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        metrics = metrics_from_args("scan_host_list", args, progress="new_hosts", profiler=profiler)
+        batches = ReadyBatches(os.path.join(output_directory, "batches"), args.batch_size, args.batch_interval,
+                               args.on_ready, args.on_ready_jobs)
+        with metrics.phase("follow"):
+            follow_scan_file(scan_file, output_directory, batches, args.idle_timeout, args.poll_interval, metrics)
+        metrics.finish(args.metrics_json)
+        profiler.finish()
+        return
+
+    metrics = metrics_from_args("scan_host_list", args, total=os.path.getsize(scan_file), progress="bytes",
+                                profiler=profiler)
+    file_type = detect_format(scan_file)
+    host_sets = PortHostSets(os.path.join(output_directory, ".spill"), args.memory_budget * 1024 * 1024)
+    if args.jobs > 1 and file_type in LINE_FORMATS:
+        with metrics.phase("parse"):
+            parse_parallel(scan_file, file_type, args.jobs, host_sets, metrics=metrics)
+    else:
+        metrics.progress = "records"
+        metrics.total = None
+        with metrics.phase("parse"):
+            for state, proto, port, host, banner in read_records(scan_file, file_type):
+                if debug:
+                    print(f"DEBUG {file_type} record = {state} {proto} {port} {host} {banner}")
+                if state == "open":
+                    host_sets.add(proto, port, host)
+                    metrics.inc("open")
+                metrics.inc("records")
+                metrics.update()
+    with metrics.phase("write"), HostFileWriter(output_directory, max_open=args.max_open_files) as writer:
+        host_sets.write_files(writer)
+    metrics.finish(args.metrics_json)
+    profiler.finish()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# Metrics for the scanner and reporting tools. Tracks counters,
+# gauges, histograms and per-phase wall time, and exposes them as
+# a rate-limited status line, a periodically rewritten Prometheus
+# textfile and a final JSON summary.
+#
+# Typical use:
+#   metrics = metrics_from_args("portscanner", args, total=n, progress="probes_sent")
+#   with metrics.phase("scan"):
+#       metrics.inc("probes_sent")
+#       metrics.observe("connect_seconds", elapsed)
+#       metrics.update()
+#   metrics.finish()
+#
+
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        """returns a list of (upper bound, cumulative count)"""
+        result = []
+        total = 0
+        for b, c in zip(self.buckets, self.counts):
+            total += c
+            result.append((b, total))
+        result.append(("+Inf", self.count))
+        return result
+
+    def dictionary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'buckets': {str(b): c for b, c in self.cumulative()},
+        }
+
+
+class ScanMetrics:
+    """Counters, gauges, histograms and phase timings for one run of a tool.
+
+    total and progress name the expected amount of work and the counter
+    that measures it, they drive the rate and ETA in the status line.
+    If a scan_profiling.Profiler is given every phase is also a profiler stage."""
+
+    def __init__(self, name, total=None, progress=None, status_interval=1.0,
+                 prometheus_file=None, prometheus_interval=10.0, stream=None, profiler=None):
+        self.name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
+        self.total = total
+        self.progress = progress
+        self.status_interval = status_interval
+        self.prometheus_file = prometheus_file
+        self.prometheus_interval = prometheus_interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.phases = {}
+        self.start = time.monotonic()
+        self.last_status = self.start
+        self.last_prometheus = self.start
+        self.last_progress = 0
+        self.current_rate = 0.0
+        self.status_written = False
+        self.profiler = profiler
+
+    def inc(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(buckets)
+        self.histograms[name].observe(value)
+
+    @contextmanager
+    def phase(self, name):
+        """Accumulates the wall time spent inside the block under name."""
+        start = time.monotonic()
+        try:
+            with self.profiler.stage(name) if self.profiler is not None else nullcontext():
+                yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def average_rate(self):
+        """returns the progress counter per second since the start"""
+        elapsed = self.elapsed()
+        if self.progress is None or elapsed <= 0:
+            return 0.0
+        return self.counters.get(self.progress, 0) / elapsed
+
+    def update(self, force=False):
+        """Writes the status line and Prometheus textfile if their intervals have passed."""
+        now = time.monotonic()
+        if self.status_interval > 0 and (force or now - self.last_status >= self.status_interval):
+            if self.progress is not None:
+                done = self.counters.get(self.progress, 0)
+                interval = now - self.last_status
+                if interval > 0:
+                    self.current_rate = (done - self.last_progress) / interval
+                self.last_progress = done
+            self.last_status = now
+            self.write_status()
+        if self.prometheus_file is not None and (force or now - self.last_prometheus >= self.prometheus_interval):
+            self.last_prometheus = now
+            self.write_prometheus(self.prometheus_file)
+
+    def status_line(self):
+        parts = ["[*] %s" % self.name]
+        if self.progress is not None:
+            done = self.counters.get(self.progress, 0)
+            if self.total:
+                parts.append("%d/%d %s (%.1f%%)" % (done, self.total, self.progress, 100.0 * done / self.total))
+            else:
+                parts.append("%d %s" % (done, self.progress))
+            parts.append("%.1f/s" % self.current_rate)
+        for k, v in self.counters.items():
+            if k != self.progress:
+                parts.append("%s=%d" % (k, v))
+        for k, v in self.gauges.items():
+            parts.append("%s=%s" % (k, "%.3g" % v if isinstance(v, float) else v))
+        parts.append("elapsed %s" % format_seconds(self.elapsed()))
+        eta = self.eta()
+        if eta is not None:
+            parts.append("eta %s" % format_seconds(eta))
+        return " ".join(parts)
+
+    def eta(self):
+        """returns the estimated seconds remaining, or None if unknown"""
+        if not self.total or self.progress is None:
+            return None
+        rate = self.current_rate or self.average_rate()
+        if rate <= 0:
+            return None
+        return max(0.0, (self.total - self.counters.get(self.progress, 0)) / rate)
+
+    def write_status(self, final=False):
+        line = self.status_line()
+        if self.stream.isatty():
+            self.stream.write("\r\033[K" + line + ("\n" if final else ""))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+        self.status_written = True
+
+    def prometheus_text(self):
+        lines = []
+        for k, v in self.counters.items():
+            metric = "%s_%s_total" % (self.name, k)
+            lines.append("# TYPE %s counter" % metric)
+            lines.append("%s %s" % (metric, v))
+        for k, v in self.gauges.items():
+            metric = "%s_%s" % (self.name, k)
+            lines.append("# TYPE %s gauge" % metric)
+            lines.append("%s %s" % (metric, v))
+        for k, h in self.histograms.items():
+            metric = "%s_%s" % (self.name, k)
+            lines.append("# TYPE %s histogram" % metric)
+            for b, c in h.cumulative():
+                lines.append('%s_bucket{le="%s"} %d' % (metric, b, c))
+            lines.append("%s_sum %s" % (metric, h.sum))
+            lines.append("%s_count %d" % (metric, h.count))
+        if self.phases:
+            metric = "%s_phase_seconds" % self.name
+            lines.append("# TYPE %s gauge" % metric)
+            for k, v in self.phases.items():
+                lines.append('%s{phase="%s"} %f' % (metric, k, v))
+        if self.progress is not None:
+            metric = "%s_rate_per_second" % self.name
+            lines.append("# TYPE %s gauge" % metric)
+            lines.append("%s %f" % (metric, self.current_rate))
+        metric = "%s_elapsed_seconds" % self.name
+        lines.append("# TYPE %s gauge" % metric)
+        lines.append("%s %f" % (metric, self.elapsed()))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Rewrites the textfile atomically so a collector never reads a partial file."""
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'w') as prom_fd:
+            prom_fd.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        result = {
+            'name': self.name,
+            'elapsed_seconds': self.elapsed(),
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'histograms': {k: h.dictionary() for k, h in self.histograms.items()},
+            'phases': dict(self.phases),
+        }
+        if self.progress is not None:
+            result['progress'] = self.progress
+            result['total'] = self.total
+            result['average_rate'] = self.average_rate()
+        return result
+
+    def finish(self, json_file=None):
+        """Writes the final status line, Prometheus textfile and JSON summary."""
+        if self.status_interval > 0:
+            self.update(force=True)
+            if self.stream.isatty():
+                self.stream.write("\n")
+        elif self.prometheus_file is not None:
+            self.write_prometheus(self.prometheus_file)
+        if json_file is not None:
+            with open(json_file, 'w') as json_fd:
+                json.dump(self.summary(), json_fd, indent=2)
+                json_fd.write("\n")
+        return self.summary()
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+def add_metrics_arguments(parser):
+    """Adds the shared metrics options to an argparse parser."""
+    group = parser.add_argument_group("metrics")
+    group.add_argument("--status-interval", type=float, default=1.0,
+                       help="seconds between status lines on stderr, 0 disables them")
+    group.add_argument("--metrics-prom", required=False, help="Prometheus textfile to rewrite periodically")
+    group.add_argument("--metrics-prom-interval", type=float, default=10.0,
+                       help="seconds between Prometheus textfile rewrites")
+    group.add_argument("--metrics-json", required=False, help="file to write a JSON metrics summary to")
+
+
+def metrics_from_args(name, args, total=None, progress=None, profiler=None):
+    """Creates a ScanMetrics from the options added by add_metrics_arguments."""
+    return ScanMetrics(name, total=total, progress=progress,
+                       status_interval=args.status_interval,
+                       prometheus_file=args.metrics_prom,
+                       prometheus_interval=args.metrics_prom_interval,
+                       profiler=profiler)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Profiling hooks shared by the Python entry points. With
+# --profile <file> each tool records per-stage wall and CPU
+# time and tracemalloc peak memory and writes them as JSON,
+# --profile-cprofile <file> additionally dumps cProfile stats
+# that can be read with pstats or snakeviz.
+#
+# Typical use:
+#   profiler = profiler_from_args("masscan_report", args)
+#   with profiler.stage("parse"):
+#       ...
+#   profiler.finish()
+#
+
+import cProfile
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Collects wall time, CPU time and peak memory per named stage."""
+
+    def __init__(self, name, output_file=None, cprofile_file=None):
+        self.name = name
+        self.output_file = output_file
+        self.cprofile_file = cprofile_file
+        self.enabled = output_file is not None or cprofile_file is not None
+        self.stages = {}
+        self.peak_stack = []
+        self.cprofile = None
+        self.started = datetime.datetime.now().isoformat()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.start_children_cpu = children_cpu_time()
+        if self.output_file is not None:
+            tracemalloc.start()
+        if self.cprofile_file is not None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    @contextmanager
+    def stage(self, name):
+        """Records the cost of the block under name, a stage entered more
+        than once accumulates its times and keeps its highest peak."""
+        if not self.enabled:
+            yield
+            return
+
+        if self.tracing():
+            # keep the peak reached so far by the enclosing stage before resetting it
+            if self.peak_stack:
+                self.peak_stack[-1] = max(self.peak_stack[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.peak_stack.append(0)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_children_cpu = children_cpu_time()
+        try:
+            yield
+        finally:
+            peak = self.peak_stack.pop()
+            if self.tracing():
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self.peak_stack:
+                    self.peak_stack[-1] = max(self.peak_stack[-1], peak)
+            s = self.stages.setdefault(name, {
+                'calls': 0,
+                'wall_seconds': 0.0,
+                'cpu_seconds': 0.0,
+                'children_cpu_seconds': 0.0,
+                'peak_memory_bytes': 0,
+            })
+            s['calls'] += 1
+            s['wall_seconds'] += time.perf_counter() - start_wall
+            s['cpu_seconds'] += time.process_time() - start_cpu
+            s['children_cpu_seconds'] += children_cpu_time() - start_children_cpu
+            s['peak_memory_bytes'] = max(s['peak_memory_bytes'], peak)
+
+    def report(self):
+        result = {
+            'tool': self.name,
+            'argv': sys.argv,
+            'python': sys.version.split()[0],
+            'pid': os.getpid(),
+            'started': self.started,
+            'wall_seconds': time.perf_counter() - self.start_wall,
+            'cpu_seconds': time.process_time() - self.start_cpu,
+            'children_cpu_seconds': children_cpu_time() - self.start_children_cpu,
+            'peak_memory_bytes': None,
+            'stages': self.stages,
+            'cprofile': self.cprofile_file,
+        }
+        if self.tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            result['peak_memory_bytes'] = max([peak] + [s['peak_memory_bytes'] for s in self.stages.values()])
+        return result
+
+    def finish(self):
+        """Writes the JSON report and cProfile dump, if requested."""
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_file)
+            self.cprofile = None
+        if self.output_file is not None:
+            with open(self.output_file, 'w') as json_fd:
+                json.dump(self.report(), json_fd, indent=2)
+                json_fd.write("\n")
+            print("[*] profile written to %s" % self.output_file, file=sys.stderr)
+        if self.tracing():
+            tracemalloc.stop()
+
+
+def children_cpu_time():
+    """returns the CPU time used by waited-for child processes, e.g. nmap"""
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+def add_profile_arguments(parser):
+    """Adds the shared profiling options to an argparse parser."""
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", required=False, metavar="FILE",
+                       help="write per-stage wall/CPU time and peak memory as JSON to FILE")
+    group.add_argument("--profile-cprofile", required=False, metavar="FILE",
+                       help="write cProfile stats to FILE")
+
+
+def profiler_from_args(name, args):
+    """Creates a Profiler from the options added by add_profile_arguments."""
+    return Profiler(name, output_file=args.profile, cprofile_file=args.profile_cprofile)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+#
+# Streaming readers for masscan and nmap output. Every format is
+# turned into the same stream of (state, proto, port, host, banner)
+# records, so the tools that build per-port host lists do not care
+# which output format the scanner wrote.
+#
+# Supported formats (detected from the start of the file):
+#   masscan         masscan -oL list output
+#   nmap            nmap -oG greppable output
+#   masscan-binary  masscan -oB binary output
+#   masscan-json    masscan -oJ JSON (and -oD ndjson) output
+#   masscan-xml     masscan -oX XML output
+#   nmap-xml        nmap -oX XML output
+#
+# The XML readers clear each <host> element once it has been read
+# and the JSON reader decodes one object at a time, so memory use
+# stays flat regardless of the file size.
+#
+
+import json
+import re
+import socket
+import struct
+import xml.etree.ElementTree as ElementTree
+
+
+LINE_FORMATS = ("masscan", "nmap")
+READ_SIZE = 1024 * 1024
+
+# masscan binary record types, see masscan's in-binary.c
+MASSCAN_OPEN = 1
+MASSCAN_CLOSED = 2
+MASSCAN_OPEN2 = 6
+MASSCAN_CLOSED2 = 7
+MASSCAN_OPEN6 = 10
+MASSCAN_CLOSED6 = 11
+IP_PROTOCOLS = {1: "icmp", 6: "tcp", 17: "udp", 132: "sctp"}
+
+JSON_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def detect_format(scan_file):
+    """Determines the scan file format from the start of the file."""
+    with open(scan_file, 'rb') as scan_fd:
+        head = scan_fd.read(4096)
+    if head.startswith(b"masscan/1."):
+        return "masscan-binary"
+    text = head.decode('utf-8', errors='replace').lstrip()
+    if text.startswith("#masscan"):
+        return "masscan"
+    elif text.startswith("# Nmap"):
+        return "nmap"
+    elif text.startswith("<"):
+        if 'scanner="masscan"' in text:
+            return "masscan-xml"
+        elif 'scanner="nmap"' in text or "<nmaprun" in text:
+            return "nmap-xml"
+    elif text.startswith("[") or text.startswith("{"):
+        return "masscan-json"
+    assert False, "file type unknown"
+
+
+def parse_text_line(line, file_type):
+    """Parses a masscan list or nmap greppable line,
+    returns a list of (state, proto, port, host, banner)."""
+    records = []
+    if not line.strip() or line[0] == "#":
+        return records
+
+    if file_type == "masscan":
+        # open tcp 80 10.1.1.1 1583262335
+        # banner tcp 80 10.1.1.1 1583262335 http Apache
+        fields = line.split()
+        state, proto, port, host = fields[:4]
+        banner = " ".join(fields[6:]) if state == "banner" else ""
+        records.append((state, proto, port, host, banner))
+    elif file_type == "nmap":
+        records = [record[:5] for record in parse_gnmap_line(line)]
+
+    return records
+
+
+def parse_gnmap_line(line):
+    """Parses a nmap greppable line,
+    returns a list of (state, proto, port, host, banner, service)."""
+    records = []
+    # Ignore these lines:
+    # Host: 10.1.1.1 ()   Status: Up
+    if "Ports:" in line:
+        # Host: 10.1.1.1 ()   Ports: 21/filtered/tcp//ftp///, 80/open/tcp//http///,
+        # 53/open|filtered/udp//domain///, 137/open/udp//netbios-ns///  Ignored State: filtered (195)
+        # nmap writes a "/" inside a field as "|", so a banner may contain ", " but never "/, "
+        host_info, port_info = line.split("Ports:", 1)
+        host = host_info.strip().split(' ')[1]
+
+        # get the port information
+        port_info = port_info.split('Ignored State:')[0].strip()
+        for p in port_info.split('/, '):
+            fields = p.strip().rstrip('/').split('/', 6)
+            if len(fields) < 3:
+                continue
+            fields += [''] * (7 - len(fields))
+            port, state, proto, _, service, _, banner = fields
+            records.append((state, proto, port, host, banner, service))
+    return records
+
+
+def read_text(scan_file, file_type):
+    with open(scan_file, 'r', errors='replace') as scan_fd:
+        for line in scan_fd:
+            yield from parse_text_line(line, file_type)
+
+
+def read_varint(data, offset):
+    """Reads one of masscan's 7-bit big-endian variable length integers."""
+    value = 0
+    while True:
+        b = data[offset]
+        offset += 1
+        value = (value << 7) | (b & 0x7f)
+        if not b & 0x80:
+            return value, offset
+
+
+def parse_masscan_record(record_type, record):
+    """Decodes a masscan binary status record, returns None for other record types."""
+    if record_type in (MASSCAN_OPEN, MASSCAN_CLOSED) and len(record) >= 12:
+        # timestamp, ip, port, reason, ttl
+        _, ip, port = struct.unpack_from(">IIH", record)
+        proto = 6
+        host = socket.inet_ntoa(struct.pack(">I", ip))
+        state = "open" if record_type == MASSCAN_OPEN else "closed"
+    elif record_type in (MASSCAN_OPEN2, MASSCAN_CLOSED2) and len(record) >= 13:
+        # timestamp, ip, ip protocol, port, reason, ttl
+        _, ip, proto, port = struct.unpack_from(">IIBH", record)
+        host = socket.inet_ntoa(struct.pack(">I", ip))
+        state = "open" if record_type == MASSCAN_OPEN2 else "closed"
+    elif record_type in (MASSCAN_OPEN6, MASSCAN_CLOSED6) and len(record) >= 26:
+        # timestamp, ip protocol, port, reason, ttl, ip version, 16 byte address
+        _, proto, port = struct.unpack_from(">IBH", record)
+        host = socket.inet_ntop(socket.AF_INET6, bytes(record[10:26]))
+        state = "open" if record_type == MASSCAN_OPEN6 else "closed"
+    else:
+        return None
+    return state, IP_PROTOCOLS.get(proto, str(proto)), str(port), host, ""
+
+
+def read_masscan_binary(scan_file):
+    """Reads masscan -oB output. The file is a sequence of [type][length][data]
+    records with varint type and length. The 99 byte file header is itself a
+    record of type 'm' and length 'a', so it is skipped like any other record."""
+    with open(scan_file, 'rb') as scan_fd:
+        data = b""
+        offset = 0
+        while True:
+            chunk = scan_fd.read(READ_SIZE)
+            data = data[offset:] + chunk
+            offset = 0
+            while True:
+                try:
+                    record_type, start = read_varint(data, offset)
+                    length, start = read_varint(data, start)
+                except IndexError:
+                    # the record header is split across reads
+                    break
+                if start + length > len(data):
+                    break
+                record = parse_masscan_record(record_type, memoryview(data)[start:start + length])
+                if record is not None:
+                    yield record
+                offset = start + length
+            if not chunk:
+                break
+
+
+def json_records(obj):
+    host = obj.get("ip")
+    for p in obj.get("ports", []):
+        service = p.get("service", {})
+        state = p.get("status", "banner" if service else "")
+        yield state, p.get("proto", ""), str(p.get("port", "")), host, service.get("banner", "")
+
+
+def read_masscan_json(scan_file):
+    """Reads masscan -oJ output one object at a time instead of loading the whole array."""
+    decoder = json.JSONDecoder()
+    with open(scan_file, 'r', errors='replace') as scan_fd:
+        buffer = ""
+        while True:
+            chunk = scan_fd.read(READ_SIZE)
+            buffer += chunk
+            position = 0
+            while True:
+                # skip whitespace, commas and the brackets of the enclosing array
+                position = JSON_SEPARATORS.match(buffer, position).end()
+                if position >= len(buffer):
+                    break
+                try:
+                    obj, position_end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if not chunk:
+                        raise
+                    # the object continues in the next read
+                    break
+                position = position_end
+                yield from json_records(obj)
+            buffer = buffer[position:]
+            if not chunk:
+                break
+
+
+def service_banner(service):
+    """Builds the version string nmap shows in greppable output from a <service> element."""
+    if service is None:
+        return ""
+    banner = " ".join(x for x in [service.get("product"), service.get("version")] if x)
+    if service.get("extrainfo"):
+        banner += " (%s)" % service.get("extrainfo")
+    # masscan puts grabbed banners in a banner attribute
+    return banner or service.get("banner", "")
+
+
+def read_xml(scan_file):
+    """Reads nmap or masscan -oX output with iterparse, clearing every
+    <host> element once its ports have been read."""
+    root = None
+    for event, elem in ElementTree.iterparse(scan_file, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event != "end" or elem.tag != "host":
+            continue
+
+        host = None
+        for address in elem.iter("address"):
+            if address.get("addrtype") in ("ipv4", "ipv6"):
+                host = address.get("addr")
+                break
+        if host is not None:
+            for port in elem.iter("port"):
+                state = port.find("state")
+                yield (state.get("state", "") if state is not None else "",
+                       port.get("protocol", ""),
+                       port.get("portid", ""),
+                       host,
+                       service_banner(port.find("service")))
+        elem.clear()
+        # drop the references the root keeps to the hosts already read
+        root.clear()
+
+
+def read_records(scan_file, file_type=None):
+    """Yields (state, proto, port, host, banner) for every port in scan_file."""
+    if file_type is None:
+        file_type = detect_format(scan_file)
+    if file_type in LINE_FORMATS:
+        return read_text(scan_file, file_type)
+    elif file_type == "masscan-binary":
+        return read_masscan_binary(scan_file)
+    elif file_type == "masscan-json":
+        return read_masscan_json(scan_file)
+    elif file_type in ("masscan-xml", "nmap-xml"):
+        return read_xml(scan_file)
+    assert False, "file type unknown"
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# On-disk cache of service detection results, so repeated runs of
+# verify_and_report.py over overlapping scopes do not probe the same
+# host, protocol and port again while the last result is still fresh.
+#
+# The cache is a SQLite database with one row per (protocol, port,
+# host) holding the state, service name, banner and the time the
+# service was last probed.
+#
+
+import os
+import sqlite3
+import time
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class ServiceCache:
+    """Service detection results keyed by protocol, port and host.
+
+    Entries probed more than max_age days ago are stale and are probed
+    again. With refresh every entry is treated as stale, the results of
+    the new probes still replace the cached ones."""
+
+    def __init__(self, path, max_age=7.0, refresh=False):
+        self.path = path
+        self.max_age = max_age
+        self.refresh = refresh
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS services (
+            protocol TEXT NOT NULL,
+            port TEXT NOT NULL,
+            host TEXT NOT NULL,
+            state TEXT NOT NULL,
+            service TEXT NOT NULL,
+            service_info TEXT NOT NULL,
+            checked REAL NOT NULL,
+            PRIMARY KEY (protocol, port, host))""")
+        self.connection.commit()
+
+    def fresh(self, protocol, port):
+        """returns {host: (state, service_info)} for the fresh entries of protocol/port"""
+        if self.refresh:
+            return {}
+        cutoff = time.time() - self.max_age * SECONDS_PER_DAY
+        rows = self.connection.execute(
+            "SELECT host, state, service_info FROM services WHERE protocol = ? AND port = ? AND checked >= ?",
+            (protocol, port, cutoff))
+        return {host: (state, service_info) for host, state, service_info in rows}
+
+    def store(self, rows):
+        """Adds or replaces (host, protocol, port, state, service_info, service) rows, checked now."""
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO services (protocol, port, host, state, service, service_info, checked) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((protocol, port, host, state, service, service_info, now)
+             for host, protocol, port, state, service_info, service in rows))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def add_cache_arguments(parser):
+    """Adds the service cache options to an argparse parser."""
+    group = parser.add_argument_group("service cache")
+    group.add_argument("--cache", metavar="FILE", required=False,
+                       help="SQLite file caching service detection results between runs")
+    group.add_argument("--max-age", type=float, default=7.0, metavar="DAYS",
+                       help="probe hosts again when their cached result is older than this")
+    group.add_argument("--refresh", action="store_true",
+                       help="probe every host, ignoring the cached results, and update the cache")
+
+
+def cache_from_args(args):
+    """returns a ServiceCache for the options added by add_cache_arguments, or None"""
+    if args.cache is None:
+        return None
+    return ServiceCache(args.cache, args.max_age, args.refresh)
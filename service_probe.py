@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+#
+# In-process service detection for the common services, so that
+# verify_and_report.py only has to start nmap for the ports this
+# cannot identify.
+#
+# The rules are read from a file in the nmap-service-probes format
+# (service_probes.txt ships a subset, nmap's own file can be used as
+# well). Each probe lists the ports it applies to and a payload to
+# send, each match line a regular expression for the response and the
+# product, version and extra information to report. Results use the
+# same service name and service_info text as nmap's -sV output in the
+# .gnmap files, e.g. "ssh" and "OpenSSH 8.2p1 Ubuntu 4ubuntu0.5
+# (Ubuntu Linux; protocol 2.0)", with "/" written as "|" the way nmap
+# does, e.g. "ssl|http" and "Golang x|crypto|ssh server".
+#
+
+import asyncio
+import os
+import re
+import ssl
+
+from tls_probe import create_context, raise_file_limit, run_bounded
+
+
+PROBES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_probes.txt")
+
+# the most of a response that is read and matched
+MAX_RESPONSE = 16 * 1024
+# once a service started answering, the rest of its answer follows within this many seconds
+RESPONSE_IDLE = 0.5
+# rough number of packets one probe connection costs, to turn a pps budget into connections per second
+PACKETS_PER_PROBE = 10
+
+ESCAPES = {'0': b'\0', 'a': b'\a', 'b': b'\b', 'f': b'\f', 'n': b'\n', 'r': b'\r', 't': b'\t', 'v': b'\v'}
+TEMPLATE_FIELDS = ('p', 'v', 'i', 'h', 'o', 'd')
+TEMPLATE_VARIABLE = re.compile(r'\$(?:(\d)|P\((\d)\)|SUBST\((\d),"([^"]*)","([^"]*)"\)|I\((\d),"([<>])"\))')
+
+
+def unescape(text):
+    """Decodes the C style escapes of a probe payload to bytes."""
+    payload = bytearray()
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c != '\\' or i + 1 == len(text):
+            payload += c.encode('latin-1')
+            i += 1
+            continue
+        escape = text[i + 1]
+        if escape == 'x':
+            payload.append(int(text[i + 2:i + 4], 16))
+            i += 4
+            continue
+        payload += ESCAPES.get(escape, escape.encode('latin-1'))
+        i += 2
+    return bytes(payload)
+
+
+def delimited(text, start):
+    """Reads a value delimited by the character at start, returns the value and the index after it."""
+    delimiter = text[start]
+    end = text.index(delimiter, start + 1)
+    return text[start + 1:end], end + 1
+
+
+def parse_ports(text):
+    """returns the set of ports in a comma separated list of ports and ranges"""
+    ports = set()
+    for item in text.split(','):
+        item = item.strip()
+        if '-' in item:
+            first, last = item.split('-', 1)
+            ports.update(str(port) for port in range(int(first), int(last) + 1))
+        elif item:
+            ports.add(item)
+    return ports
+
+
+def gnmap_escape(text):
+    """returns text with "/" written as "|", the way nmap writes greppable output fields"""
+    return text.replace('/', '|')
+
+
+def printable(value):
+    return bytes(b for b in value if 0x20 <= b < 0x7f)
+
+
+class Match:
+    """A match line: the service, the response pattern and the version templates."""
+
+    def __init__(self, service, pattern, templates):
+        self.service = service
+        self.pattern = pattern
+        self.templates = templates
+
+    def substitute(self, template, match):
+        def variable(m):
+            if m.group(1):
+                value = match.group(int(m.group(1))) or b''
+            elif m.group(2):
+                value = printable(match.group(int(m.group(2))) or b'')
+            elif m.group(3):
+                value = (match.group(int(m.group(3))) or b'').replace(
+                    m.group(4).encode('latin-1'), m.group(5).encode('latin-1'))
+            else:
+                value = match.group(int(m.group(6))) or b''
+                value = str(int.from_bytes(value, 'big' if m.group(7) == '>' else 'little')).encode()
+            return value.decode('latin-1')
+        return TEMPLATE_VARIABLE.sub(variable, template)
+
+    def service_info(self, match):
+        """returns the product, version and extra information as nmap writes them to .gnmap files"""
+        fields = {name: self.substitute(template, match).strip() for name, template in self.templates.items()}
+        info = " ".join(fields[name] for name in ('p', 'v') if fields.get(name))
+        if fields.get('i'):
+            info = "%s (%s)" % (info, fields['i']) if info else "(%s)" % fields['i']
+        return gnmap_escape(info)
+
+
+class Probe:
+    """A probe: the payload to send, the ports it applies to and its match lines."""
+
+    def __init__(self, name, payload):
+        self.name = name
+        self.payload = payload
+        self.ports = set()
+        self.sslports = set()
+        self.wait = 6.0
+        self.matches = []
+
+    def identify(self, response):
+        """returns (service, service_info) for the first match line matching response, or None"""
+        for match in self.matches:
+            m = match.pattern.search(response)
+            if m is not None:
+                return match.service, match.service_info(m)
+        return None
+
+
+def parse_match(line):
+    """Parses the rest of a match line after "match ", returns a Match."""
+    service, rest = line.split(' ', 1)
+    if not rest.startswith('m'):
+        raise ValueError("expected m|regex|")
+    pattern, i = delimited(rest, 1)
+    flags = 0
+    while i < len(rest) and rest[i] in 'si':
+        flags |= re.DOTALL if rest[i] == 's' else re.IGNORECASE
+        i += 1
+    templates = {}
+    while i < len(rest):
+        if rest[i] == ' ':
+            i += 1
+        elif rest[i] in TEMPLATE_FIELDS and i + 1 < len(rest):
+            templates[rest[i]], i = delimited(rest, i + 1)
+        elif rest.startswith('cpe:', i):
+            _, i = delimited(rest, i + 4)
+            # cpe:/.../a
+            while i < len(rest) and rest[i] != ' ':
+                i += 1
+        else:
+            raise ValueError("unexpected %r" % rest[i:])
+    return Match(service, re.compile(pattern.encode('latin-1'), flags), templates)
+
+
+def parse_probes(path):
+    """Reads the TCP probes of an nmap-service-probes file, returns (probes, warnings).
+    Lines that cannot be parsed, e.g. patterns Python's re does not support, are skipped
+    and reported in warnings."""
+    probes = []
+    warnings = []
+    probe = None
+    with open(path, 'r', encoding='latin-1') as probes_fd:
+        for number, line in enumerate(probes_fd, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            directive, _, rest = line.partition(' ')
+            try:
+                if directive == 'Probe':
+                    protocol, name, payload = rest.split(' ', 2)
+                    if protocol != 'TCP':
+                        probe = None
+                        continue
+                    probe = Probe(name, unescape(delimited(payload, 1)[0]))
+                    probes.append(probe)
+                elif probe is None:
+                    continue
+                elif directive == 'ports':
+                    probe.ports = parse_ports(rest)
+                elif directive == 'sslports':
+                    probe.sslports = parse_ports(rest)
+                elif directive == 'totalwaitms':
+                    probe.wait = int(rest) / 1000.0
+                elif directive == 'match':
+                    probe.matches.append(parse_match(rest))
+            except (ValueError, IndexError, re.error) as err:
+                warnings.append("%s:%d: %s" % (path, number, err))
+    return probes, warnings
+
+
+class ProbeRules:
+    """The probes indexed by port.
+
+    A port is probed with the probes listing it in their ports or
+    sslports, in file order, so a web port gets the GET request right
+    away instead of first waiting for a banner. Ports no probe lists
+    are not probed."""
+
+    def __init__(self, probes):
+        self.by_port = {}
+        self.ssl_ports = set()
+        for probe in probes:
+            for port in probe.ports | probe.sslports:
+                self.by_port.setdefault(port, []).append(probe)
+            self.ssl_ports |= probe.sslports
+
+    def ports(self):
+        return set(self.by_port)
+
+    def probes(self, port):
+        return self.by_port.get(port, [])
+
+
+def load_rules(path=None):
+    """returns (ProbeRules, warnings) for the probes file at path, default the shipped subset"""
+    probes, warnings = parse_probes(path or PROBES_FILE)
+    return ProbeRules(probes), warnings
+
+
+class ServiceProber:
+    """Identifies services with the probe rules, many connections at a time.
+
+    At most concurrency connections are open at once and, with rate
+    set, at most rate connections are started per second."""
+
+    def __init__(self, rules, concurrency=500, timeout=5.0, rate=0):
+        self.rules = rules
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate = rate
+        self.context = create_context(None)
+        self.next_start = 0.0
+
+    async def throttle(self):
+        if self.rate <= 0:
+            return
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + 1.0 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def exchange(self, host, port, payload, tls, wait):
+        """Connects to host:port, sends payload and returns the response read within wait
+        seconds, or None if the connection (or the TLS handshake) failed."""
+        await self.throttle()
+        loop = asyncio.get_running_loop()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, int(port), ssl=self.context if tls else None,
+                                        server_hostname=host if tls else None),
+                self.timeout)
+            if payload:
+                writer.write(payload)
+                await writer.drain()
+            response = b''
+            deadline = loop.time() + wait
+            while len(response) < MAX_RESPONSE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    data = await asyncio.wait_for(reader.read(4096), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if not data:
+                    break
+                response += data
+                deadline = min(deadline, loop.time() + RESPONSE_IDLE)
+            return response
+        except (asyncio.TimeoutError, OSError, ssl.SSLError):
+            return None
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    await asyncio.wait_for(writer.wait_closed(), 1)
+                except (asyncio.TimeoutError, OSError, ssl.SSLError):
+                    pass
+
+    async def identify(self, host, port):
+        """returns (service, service_info) for host:port, or None if no rule identified it"""
+        probes = self.rules.probes(port)
+        # on SSL ports try TLS first and fall back to plain text if the handshake fails
+        for tls in ([True, False] if port in self.rules.ssl_ports else [False]):
+            connected = False
+            for probe in probes:
+                response = await self.exchange(host, port, probe.payload, tls, probe.wait)
+                if response is None:
+                    break
+                connected = True
+                found = probe.identify(response)
+                if found is not None:
+                    service, service_info = found
+                    service = gnmap_escape(service)
+                    return ("ssl|" + service if tls else service), service_info
+            if connected:
+                break
+        return None
+
+    async def probe_all(self, targets, result_callback):
+        """Identifies every (host, port) in targets, calling result_callback(host, port, result)."""
+        await run_bounded(targets, self.concurrency, lambda target: self.identify(*target),
+                          lambda target, result: result_callback(target[0], target[1], result))
+
+
+def add_native_arguments(parser):
+    """Adds the native service probe options to an argparse parser."""
+    group = parser.add_argument_group("native service probes")
+    group.add_argument("--native", action="store_true",
+                       help="identify common services in-process first, only the rest is probed with nmap")
+    group.add_argument("--probes-file", metavar="FILE", required=False,
+                       help="nmap-service-probes format rules (default: service_probes.txt)")
+    group.add_argument("--native-concurrency", type=int, default=500, metavar="N",
+                       help="number of native probe connections in flight")
+    group.add_argument("--native-timeout", type=float, default=5.0, metavar="SECONDS",
+                       help="deadline for each native probe connection")
+
+
+def prober_from_args(args, max_pps, verboseprint):
+    """returns a ServiceProber for the options added by add_native_arguments, or None"""
+    if not args.native:
+        return None
+    rules, warnings = load_rules(args.probes_file)
+    for warning in warnings:
+        verboseprint("[-] skipped probe rule %s" % warning)
+    raise_file_limit(args.native_concurrency)
+    # at least one connection per second, a rate of 0 would turn the throttle off
+    return ServiceProber(rules, args.native_concurrency, args.native_timeout, max(1, max_pps // PACKETS_PER_PROBE))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Checks reporting/masscan_report.py -s against nmap greppable output
+# whose banners contain ", ".
+#
+# Usage: python3 -m unittest discover tests
+#
+
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+MASSCAN_REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                              "reporting", "masscan_report.py")
+
+MASSCAN_LIST = """#masscan
+open tcp 22 10.1.1.1 1583262335
+open udp 161 10.1.1.1 1583262335
+open tcp 443 10.1.1.2 1583262335
+# end
+"""
+
+GNMAP = """# Nmap 7.80 scan initiated as: nmap -sU -sV -p22,161 -iL hosts.txt -oG out.gnmap
+Host: 10.1.1.1 ()\tStatus: Up
+Host: 10.1.1.1 ()\tPorts: 22/open/tcp//ssh//OpenSSH 8.2p1 Ubuntu 4ubuntu0.5 (Ubuntu Linux; protocol 2.0)/, \
+161/open/udp//snmp//Ubiquiti Networks, Inc. SNMPv3 server/\tIgnored State: closed (998)
+Host: 10.1.1.2 ()\tStatus: Up
+Host: 10.1.1.2 ()\tPorts: 443/open/tcp//ssl|http//nginx, reverse proxy/
+# Nmap done at x -- 2 IP addresses (2 hosts up) scanned in 1.00 seconds
+"""
+
+
+class CommaBannerTest(unittest.TestCase):
+
+    def test_comma_banners(self):
+        with tempfile.TemporaryDirectory() as directory:
+            service_directory = os.path.join(directory, "services")
+            os.mkdir(service_directory)
+            with open(os.path.join(service_directory, "service_detection.gnmap"), 'w') as gnmap_fd:
+                gnmap_fd.write(GNMAP)
+            targets_file = os.path.join(directory, "targets.txt")
+            with open(targets_file, 'w') as targets_fd:
+                targets_fd.write("10.1.1.0/24\n")
+            masscan_file = os.path.join(directory, "scan.masscan")
+            with open(masscan_file, 'w') as masscan_fd:
+                masscan_fd.write(MASSCAN_LIST)
+            detail_file = os.path.join(directory, "detail.csv")
+
+            result = subprocess.run([sys.executable, MASSCAN_REPORT, "-s", service_directory, "-j", "1",
+                                     "-C", detail_file, targets_file, masscan_file],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertIn("open:snmp:Ubiquiti Networks, Inc. SNMPv3 server", result.stdout)
+            self.assertIn("open:ssh:OpenSSH 8.2p1 Ubuntu 4ubuntu0.5 (Ubuntu Linux; protocol 2.0)", result.stdout)
+            self.assertIn("open:ssl|http:nginx, reverse proxy", result.stdout)
+
+            with open(detail_file, 'r', newline='') as detail_fd:
+                rows = {(row['ip'], row['proto'], row['port']): row['service_info']
+                        for row in csv.DictReader(detail_fd)}
+            self.assertEqual(rows[('10.1.1.1', 'udp', '161')], "Ubiquiti Networks, Inc. SNMPv3 server")
+            self.assertEqual(rows[('10.1.1.2', 'tcp', '443')], "nginx, reverse proxy")
+
+
+if __name__ == "__main__":
+    unittest.main()
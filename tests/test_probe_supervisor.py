@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# Checks that verify_and_report.py's ProbeSupervisor hands the whole
+# pps budget to the last running nmap job, using a stand-in nmap that
+# takes work / --max-rate seconds per host.
+#
+# Usage: python3 -m unittest discover tests
+#
+
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from scan_metrics import ScanMetrics
+from verify_and_report import ProbeJob, ProbeSupervisor, completed_hosts
+
+
+FAKE_NMAP = """#!%s
+import os, sys, time
+args = sys.argv[1:]
+option = lambda name: args[args.index(name) + 1]
+with open(os.environ["FAKE_NMAP_LOG"], "a") as log_fd:
+    log_fd.write(" ".join(args) + "\\n")
+port = [x[2:] for x in args if x.startswith("-p") and x != "-Pn"][0]
+delay = float(os.environ["FAKE_NMAP_WORK"]) / float(option("--max-rate"))
+hosts = [line.strip() for line in open(option("-iL")) if line.strip()]
+with open(option("-oG"), "w") as output_fd:
+    output_fd.write("# Nmap 7.80 scan initiated as: nmap %%s\\n" %% " ".join(args))
+    output_fd.flush()
+    for host in hosts:
+        time.sleep(delay)
+        output_fd.write("Host: %%s ()\\tPorts: %%s/open/tcp//http//Banner, v1/\\n" %% (host, port))
+        output_fd.flush()
+    output_fd.write("# Nmap done at x -- %%d IP addresses (%%d hosts up) scanned in 0.1 seconds\\n" %%
+                    (len(hosts), len(hosts)))
+""" % sys.executable
+
+
+class RebalanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        bin_directory = os.path.join(self.directory.name, "bin")
+        os.mkdir(bin_directory)
+        nmap = os.path.join(bin_directory, "nmap")
+        with open(nmap, 'w') as nmap_fd:
+            nmap_fd.write(FAKE_NMAP)
+        os.chmod(nmap, os.stat(nmap).st_mode | stat.S_IXUSR)
+        self.log = os.path.join(self.directory.name, "nmap.log")
+        self.environ = dict(os.environ)
+        os.environ["PATH"] = bin_directory + os.pathsep + os.environ["PATH"]
+        os.environ["FAKE_NMAP_LOG"] = self.log
+        os.environ["FAKE_NMAP_WORK"] = "8"
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        self.directory.cleanup()
+
+    def job(self, port, num_hosts):
+        host_file = os.path.join(self.directory.name, "tcp_%d.txt" % port)
+        with open(host_file, 'w') as host_fd:
+            host_fd.writelines("10.%d.%d.%d\n" % (port % 256, i // 256, i % 256) for i in range(num_hosts))
+        output_file = os.path.join(self.directory.name, "service_detection_tcp_%d.gnmap" % port)
+        return ProbeJob("tcp", str(port), host_file, output_file, num_hosts)
+
+    def test_last_job_gets_max_pps(self):
+        jobs = [self.job(443, 300), self.job(80, 20), self.job(22, 20), self.job(21, 20)]
+        metrics = ScanMetrics("test", status_interval=0, stream=open(os.devnull, 'w'))
+        supervisor = ProbeSupervisor(jobs, 4, 1000, self.directory.name, metrics, lambda *a, **k: None)
+        supervisor.run()
+        metrics.stream.close()
+
+        with open(self.log, 'r') as log_fd:
+            runs = [line.split() for line in log_fd if "-p443" in line.split()]
+        rates = [int(run[run.index("--max-rate") + 1]) for run in runs]
+        self.assertEqual(rates[0], 250)
+        # relaunched once the short jobs finished, again once the last of them did
+        self.assertEqual(rates[-1], 1000, rates)
+        final_output = os.path.join(self.directory.name, "service_detection_tcp_443.gnmap")
+        self.assertEqual(len(completed_hosts(final_output)), 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
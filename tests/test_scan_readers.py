@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+#
+# Checks the record streams of the scan_readers.py parsers on small
+# hand-built masscan -oB, -oJ and -oX and nmap -oX files.
+#
+# Usage: python3 -m unittest discover tests
+#
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import scan_readers
+from scan_readers import detect_format, read_records
+
+
+def varint(value):
+    """Encodes value as one of masscan's 7-bit big-endian variable length integers."""
+    groups = [value & 0x7f]
+    value >>= 7
+    while value:
+        groups.append(0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(reversed(groups))
+
+
+def binary_record(record_type, data):
+    return varint(record_type) + varint(len(data)) + data
+
+
+def masscan_binary():
+    """returns a masscan -oB file: the header, IPv4 and IPv6 status records and a banner record"""
+    # the 99 byte header reads as a record of type 'm' and length 'a'
+    header = b"masscan/1.1\n".ljust(99, b"\0")
+    # timestamp, ip, ip protocol, port, reason, ttl
+    open_tcp = struct.pack(">IIBHBB", 1583262335, 0x0a010101, 6, 443, 0x12, 64)
+    closed_udp = struct.pack(">IIBHBB", 1583262335, 0x0a010102, 17, 53, 0x04, 64)
+    # timestamp, ip protocol, port, reason, ttl, ip version, 16 byte address
+    open_ipv6 = struct.pack(">IBHBBB", 1583262335, 6, 22, 0x12, 64, 6) + \
+        socket.inet_pton(socket.AF_INET6, "2001:db8::1")
+    # banner records are skipped, this one needs a two byte length
+    banner = b"\0" * 200
+    return header + binary_record(6, open_tcp) + binary_record(5, banner) + \
+        binary_record(7, closed_udp) + binary_record(10, open_ipv6)
+
+
+MASSCAN_JSON = [
+    {"ip": "10.1.1.1", "timestamp": "1583262335",
+     "ports": [{"port": 80, "proto": "tcp", "status": "open", "reason": "syn-ack", "ttl": 64}]},
+    {"ip": "10.1.1.2", "timestamp": "1583262335",
+     "ports": [{"port": 443, "proto": "tcp", "status": "open", "reason": "syn-ack", "ttl": 64}]},
+    {"ip": "10.1.1.1", "timestamp": "1583262336",
+     "ports": [{"port": 80, "proto": "tcp", "service": {"name": "http", "banner": "HTTP/1.1 200 OK, nginx"}}]},
+]
+
+MASSCAN_XML = """<?xml version="1.0"?>
+<nmaprun scanner="masscan" start="1583262335" version="1.0-BETA" xmloutputversion="1.03">
+<scaninfo type="syn" protocol="tcp" />
+<host endtime="1583262335"><address addr="10.1.1.1" addrtype="ipv4"/><ports><port protocol="tcp" portid="80"><state state="open" reason="syn-ack" reason_ttl="64"/></port></ports></host>
+<host endtime="1583262335"><address addr="10.1.1.2" addrtype="ipv4"/><ports><port protocol="udp" portid="161"><state state="open" reason="none" reason_ttl="64"/><service name="snmp" banner="Ubiquiti Networks, Inc."/></port></ports></host>
+<runstats><finished time="1583262340" timestr="2020-03-03 19:05:40" elapsed="5" /></runstats>
+</nmaprun>
+"""
+
+NMAP_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE nmaprun>
+<nmaprun scanner="nmap" args="nmap -sV -oX out.xml 10.1.1.1" start="1583262335" version="7.80" xmloutputversion="1.04">
+<host><status state="up" reason="user-set"/>
+<address addr="10.1.1.1" addrtype="ipv4"/>
+<address addr="00:11:22:33:44:55" addrtype="mac"/>
+<ports><extraports state="closed" count="998"/>
+<port protocol="tcp" portid="22"><state state="open" reason="syn-ack" reason_ttl="64"/><service name="ssh" product="OpenSSH" version="8.2p1 Ubuntu 4ubuntu0.5" extrainfo="Ubuntu Linux; protocol 2.0" method="probed" conf="10"/></port>
+<port protocol="tcp" portid="25"><state state="filtered" reason="no-response" reason_ttl="0"/><service name="smtp" method="table" conf="3"/></port>
+</ports></host>
+<host><status state="up" reason="user-set"/>
+<address addr="2001:db8::2" addrtype="ipv6"/>
+<ports><port protocol="tcp" portid="443"><state state="open" reason="syn-ack" reason_ttl="64"/><service name="http" product="nginx" tunnel="ssl" method="probed" conf="10"/></port></ports></host>
+<runstats><finished time="1583262340"/><hosts up="2" down="0" total="2"/></runstats>
+</nmaprun>
+"""
+
+
+class ScanReadersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb' if isinstance(data, bytes) else 'w') as scan_fd:
+            scan_fd.write(data)
+        return path
+
+    def test_masscan_binary(self):
+        path = self.write("scan.bin", masscan_binary())
+        expected = [
+            ("open", "tcp", "443", "10.1.1.1", ""),
+            ("closed", "udp", "53", "10.1.1.2", ""),
+            ("open", "tcp", "22", "2001:db8::1", ""),
+        ]
+        self.assertEqual(detect_format(path), "masscan-binary")
+        self.assertEqual(list(read_records(path)), expected)
+        # records and their varint headers split across reads
+        for read_size in (1, 7, 100):
+            with mock.patch.object(scan_readers, "READ_SIZE", read_size):
+                self.assertEqual(list(read_records(path)), expected, "READ_SIZE %d" % read_size)
+
+    def test_masscan_json(self):
+        # masscan -oJ writes one object per line, older versions leave a comma before the closing bracket
+        text = "[\n" + "".join("%s,\n" % json.dumps(obj) for obj in MASSCAN_JSON) + "]\n"
+        path = self.write("scan.json", text)
+        expected = [
+            ("open", "tcp", "80", "10.1.1.1", ""),
+            ("open", "tcp", "443", "10.1.1.2", ""),
+            ("banner", "tcp", "80", "10.1.1.1", "HTTP/1.1 200 OK, nginx"),
+        ]
+        self.assertEqual(detect_format(path), "masscan-json")
+        self.assertEqual(list(read_records(path)), expected)
+        # objects split across reads
+        for read_size in (1, 16, 150):
+            with mock.patch.object(scan_readers, "READ_SIZE", read_size):
+                self.assertEqual(list(read_records(path)), expected, "READ_SIZE %d" % read_size)
+
+    def test_masscan_ndjson(self):
+        path = self.write("scan.ndjson", "".join("%s\n" % json.dumps(obj) for obj in MASSCAN_JSON))
+        self.assertEqual(detect_format(path), "masscan-json")
+        self.assertEqual(len(list(read_records(path))), 3)
+
+    def test_masscan_xml(self):
+        path = self.write("scan.xml", MASSCAN_XML)
+        self.assertEqual(detect_format(path), "masscan-xml")
+        self.assertEqual(list(read_records(path)), [
+            ("open", "tcp", "80", "10.1.1.1", ""),
+            ("open", "udp", "161", "10.1.1.2", "Ubiquiti Networks, Inc."),
+        ])
+
+    def test_nmap_xml(self):
+        path = self.write("scan.xml", NMAP_XML)
+        self.assertEqual(detect_format(path), "nmap-xml")
+        self.assertEqual(list(read_records(path)), [
+            ("open", "tcp", "22", "10.1.1.1", "OpenSSH 8.2p1 Ubuntu 4ubuntu0.5 (Ubuntu Linux; protocol 2.0)"),
+            ("filtered", "tcp", "25", "10.1.1.1", ""),
+            ("open", "tcp", "443", "2001:db8::2", "nginx"),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
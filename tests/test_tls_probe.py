@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+# Checks tls_probe.py against a local TLS server with a self-signed
+# certificate generated by the openssl command line tool.
+#
+# Usage: python3 -m unittest discover tests
+#
+
+import asyncio
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from tls_probe import create_context, probe_tls
+
+
+SUBJECT = "/C=US/O=Example Corp/CN=test.example.com"
+SAN = "subjectAltName=DNS:test.example.com,DNS:www.example.com,IP:127.0.0.1"
+
+
+def generate_certificate(directory):
+    """Writes a self-signed certificate and key to directory, returns their paths."""
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "30",
+                    "-subj", SUBJECT, "-addext", SAN, "-keyout", key_file, "-out", cert_file],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert_file, key_file
+
+
+@unittest.skipUnless(shutil.which("openssl"), "openssl is not installed")
+class ProbeTlsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cert_file, self.key_file = generate_certificate(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def probe(self, server_context, alpn_protocols):
+        async def run():
+            async def handle(reader, writer):
+                await reader.read()
+                writer.close()
+
+            server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=server_context)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await probe_tls("127.0.0.1", str(port), create_context(alpn_protocols), 5)
+        return asyncio.run(run())
+
+    def server_context(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert_file, self.key_file)
+        return context
+
+    def test_handshake_and_certificate(self):
+        context = self.server_context()
+        context.minimum_version = ssl.TLSVersion.TLSv1_3
+        context.set_alpn_protocols(["http/1.1"])
+        result = self.probe(context, ["h2", "http/1.1"])
+
+        self.assertEqual(result['error'], '')
+        self.assertEqual(result['protocol'], "tcp")
+        self.assertEqual(result['tls_version'], "TLSv1.3")
+        self.assertTrue(result['cipher'].startswith("TLS_"))
+        self.assertGreaterEqual(result['cipher_bits'], 128)
+        self.assertEqual(result['alpn'], "http/1.1")
+        self.assertEqual(result['subject'], "C=US, O=Example Corp, CN=test.example.com")
+        # self-signed, so the issuer is the subject
+        self.assertEqual(result['issuer'], result['subject'])
+        self.assertEqual(result['san'], "DNS:test.example.com; DNS:www.example.com; IP:127.0.0.1")
+        self.assertTrue(result['not_before'].endswith("Z"))
+        self.assertLess(result['not_before'], result['not_after'])
+
+    def test_tls12_without_alpn(self):
+        context = self.server_context()
+        context.maximum_version = ssl.TLSVersion.TLSv1_2
+        result = self.probe(context, [])
+
+        self.assertEqual(result['error'], '')
+        self.assertEqual(result['tls_version'], "TLSv1.2")
+        self.assertEqual(result['alpn'], '')
+        self.assertEqual(result['subject'], "C=US, O=Example Corp, CN=test.example.com")
+
+    def test_closed_port(self):
+        result = asyncio.run(probe_tls("127.0.0.1", "1", create_context(None), 5))
+        self.assertNotEqual(result['error'], '')
+        self.assertEqual(result['tls_version'], '')
+
+
+if __name__ == "__main__":
+    unittest.main()
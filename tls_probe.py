@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+#
+# Performs a TLS handshake against every host in a
+# directory of per-port host files (as produced by
+# scan_host_list.py) and records the negotiated TLS
+# parameters and certificate details in a CSV file.
+#
+# Usage:
+# tls_probe.py [OPTIONS] <host directory> <output file>
+# OPTIONS:
+#   -p, --ports <comma separated list of ports>     only probe these TCP ports (default: all tcp_*.txt files)
+#   -c, --concurrency <n>                           number of handshakes in flight (default: 500)
+#   -t, --timeout <seconds>                         deadline for connect and handshake (default: 5)
+#   -a, --alpn <comma separated list>               ALPN protocols to offer (default: h2,http/1.1)
+#   -v, --verbose                                   provide verbose output
+#
+
+import argparse
+import asyncio
+import csv
+import datetime
+import os
+import resource
+import ssl
+
+
+FIELD_NAMES = ['host', 'protocol', 'port', 'tls_version', 'cipher', 'cipher_bits', 'alpn',
+               'subject', 'san', 'issuer', 'not_before', 'not_after', 'error']
+
+# short names for the relative distinguished names seen in certificates
+OID_NAMES = {
+    '2.5.4.3': 'CN',
+    '2.5.4.5': 'serialNumber',
+    '2.5.4.6': 'C',
+    '2.5.4.7': 'L',
+    '2.5.4.8': 'ST',
+    '2.5.4.10': 'O',
+    '2.5.4.11': 'OU',
+    '1.2.840.113549.1.9.1': 'emailAddress',
+    '0.9.2342.19200300.100.1.25': 'DC',
+}
+OID_SUBJECT_ALT_NAME = '2.5.29.17'
+
+
+def der_element(data, offset):
+    """Reads the DER element at offset, returns tag, content start and content end."""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        num_bytes = length & 0x7f
+        length = int.from_bytes(data[offset:offset + num_bytes], 'big')
+        offset += num_bytes
+    return tag, offset, offset + length
+
+
+def der_children(data, start, end):
+    """Returns a list of (tag, start, end) for the elements between start and end."""
+    children = []
+    while start < end:
+        tag, content_start, content_end = der_element(data, start)
+        children.append((tag, content_start, content_end))
+        start = content_end
+    return children
+
+
+def der_oid(data):
+    """Decodes a DER object identifier into dotted notation."""
+    values = []
+    value = 0
+    for b in data:
+        value = (value << 7) | (b & 0x7f)
+        if not b & 0x80:
+            values.append(value)
+            value = 0
+    first = min(values[0] // 40, 2)
+    return '.'.join(str(x) for x in [first, values[0] - first * 40] + values[1:])
+
+
+def der_time(tag, data):
+    """Decodes a UTCTime or GeneralizedTime into an ISO 8601 string."""
+    value = data.decode('ascii').rstrip('Z')
+    if tag == 0x17:
+        # UTCTime has a two digit year
+        year = int(value[:2])
+        value = str(1900 + year if year >= 50 else 2000 + year) + value[2:]
+    return datetime.datetime.strptime(value[:14], '%Y%m%d%H%M%S').isoformat() + 'Z'
+
+
+def der_name(data, start, end):
+    """Decodes an X.509 Name into a string such as 'CN=example.com, O=Example'."""
+    parts = []
+    for _, set_start, set_end in der_children(data, start, end):
+        for _, seq_start, seq_end in der_children(data, set_start, set_end):
+            (_, oid_start, oid_end), (_, value_start, value_end) = der_children(data, seq_start, seq_end)[:2]
+            oid = der_oid(data[oid_start:oid_end])
+            value = data[value_start:value_end].decode('utf-8', errors='replace')
+            parts.append("%s=%s" % (OID_NAMES.get(oid, oid), value))
+    return ", ".join(parts)
+
+
+def parse_certificate(der):
+    """Extracts the subject, issuer, validity and subject alternative names
+    from a DER encoded certificate."""
+    _, cert_start, cert_end = der_element(der, 0)
+    _, tbs_start, tbs_end = der_children(der, cert_start, cert_end)[0]
+    fields = der_children(der, tbs_start, tbs_end)
+    if fields[0][0] == 0xa0:
+        # skip the explicit version
+        fields = fields[1:]
+    # serialNumber, signature, issuer, validity, subject, subjectPublicKeyInfo, ...
+    issuer = der_name(der, fields[2][1], fields[2][2])
+    (nb_tag, nb_start, nb_end), (na_tag, na_start, na_end) = der_children(der, fields[3][1], fields[3][2])
+    subject = der_name(der, fields[4][1], fields[4][2])
+
+    san = []
+    for tag, start, end in fields[6:]:
+        if tag != 0xa3:
+            continue
+        # extensions are wrapped in an explicit [3] tag
+        _, exts_start, exts_end = der_element(der, start)
+        for _, ext_start, ext_end in der_children(der, exts_start, exts_end):
+            ext = der_children(der, ext_start, ext_end)
+            if der_oid(der[ext[0][1]:ext[0][2]]) != OID_SUBJECT_ALT_NAME:
+                continue
+            _, value_start, value_end = ext[-1]
+            _, names_start, names_end = der_element(der, value_start)
+            for name_tag, name_start, name_end in der_children(der, names_start, names_end):
+                value = der[name_start:name_end]
+                if name_tag == 0x82:
+                    san.append("DNS:%s" % value.decode('ascii', errors='replace'))
+                elif name_tag == 0x87 and len(value) == 4:
+                    san.append("IP:%s" % ".".join(str(x) for x in value))
+                elif name_tag == 0x81:
+                    san.append("email:%s" % value.decode('ascii', errors='replace'))
+                elif name_tag == 0x86:
+                    san.append("URI:%s" % value.decode('ascii', errors='replace'))
+
+    return {
+        'subject': subject,
+        'issuer': issuer,
+        'san': "; ".join(san),
+        'not_before': der_time(nb_tag, der[nb_start:nb_end]),
+        'not_after': der_time(na_tag, der[na_start:na_end]),
+    }
+
+
+def create_context(alpn_protocols):
+    """Creates a client context that accepts any certificate and protocol version."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        context.minimum_version = ssl.TLSVersion.MINIMUM_SUPPORTED
+        context.set_ciphers("ALL:@SECLEVEL=0")
+    except (ValueError, ssl.SSLError):
+        pass
+    if alpn_protocols:
+        context.set_alpn_protocols(alpn_protocols)
+    return context
+
+
+async def probe_tls(host, port, context, timeout):
+    """Connects to host:port and performs a TLS handshake within timeout seconds,
+    returns a dictionary with the negotiated parameters."""
+    result = dict.fromkeys(FIELD_NAMES, '')
+    result.update({'host': host, 'protocol': 'tcp', 'port': port})
+    writer = None
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, int(port), ssl=context, server_hostname=host),
+            timeout)
+        ssl_object = writer.get_extra_info('ssl_object')
+        cipher_name, _, cipher_bits = ssl_object.cipher()
+        result['tls_version'] = ssl_object.version()
+        result['cipher'] = cipher_name
+        result['cipher_bits'] = cipher_bits
+        result['alpn'] = ssl_object.selected_alpn_protocol() or ''
+        der = ssl_object.getpeercert(binary_form=True)
+        if der:
+            try:
+                result.update(parse_certificate(der))
+            except (IndexError, ValueError) as err:
+                result['error'] = "certificate parse error: %s" % err
+    except asyncio.TimeoutError:
+        result['error'] = "timeout"
+    except (OSError, ssl.SSLError) as err:
+        result['error'] = str(err) or err.__class__.__name__
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await asyncio.wait_for(writer.wait_closed(), 1)
+            except (asyncio.TimeoutError, OSError, ssl.SSLError):
+                pass
+    return result
+
+
+def read_targets(host_directory, ports):
+    """Yields (host, port) for every host in the tcp_<port>.txt files of host_directory."""
+    for f in sorted(os.listdir(host_directory)):
+        name, extension = os.path.splitext(f)
+        if extension != ".txt" or not name.startswith("tcp_"):
+            continue
+        port = name.split("_")[1]
+        if ports and port not in ports:
+            continue
+        with open(os.path.join(host_directory, f), 'r') as host_fd:
+            for line in host_fd:
+                host = line.strip()
+                if host:
+                    yield host, port
+
+
+async def run_bounded(targets, concurrency, probe, result_callback):
+    """Awaits probe(target) for every target with at most concurrency probes in flight,
+    calling result_callback(target, result) as each one finishes. targets is read
+    as the probes go, so it can be a generator over more targets than fit in memory."""
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while True:
+            target = await queue.get()
+            if target is None:
+                return
+            result_callback(target, await probe(target))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    for target in targets:
+        await queue.put(target)
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+
+
+async def probe_all(targets, context, concurrency, timeout, result_callback):
+    """Probes every (host, port) in targets with at most concurrency handshakes in flight."""
+    await run_bounded(targets, concurrency, lambda target: probe_tls(target[0], target[1], context, timeout),
+                      lambda target, result: result_callback(result))
+
+
+def raise_file_limit(concurrency):
+    """Raises the open file limit so it does not cap the concurrency."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = concurrency + 64
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def main():
+    verbose = False
+
+    parser = argparse.ArgumentParser(description="performs TLS handshakes against hosts in a scan_host_list.py directory")
+    parser.add_argument("-p", "--ports", required=False, help="TCP ports to probe, comma-separated")
+    parser.add_argument("-c", "--concurrency", type=int, default=500, help="number of handshakes in flight")
+    parser.add_argument("-t", "--timeout", type=float, default=5.0, help="deadline in seconds for connect and handshake")
+    parser.add_argument("-a", "--alpn", default="h2,http/1.1", help="ALPN protocols to offer, comma-separated")
+    parser.add_argument("-v", "--verbose", action="store_true", required=False, help="provide verbose output")
+    parser.add_argument("host_directory", help="directory of <protocol>_<port>.txt host files")
+    parser.add_argument("output_file", help="CSV file to write the results to")
+    args = parser.parse_args()
+
+    assert os.path.isdir(args.host_directory), "host directory %s does not exist" % args.host_directory
+    ports = []
+    if args.ports is not None:
+        ports = [x.strip() for x in args.ports.split(",")]
+    alpn_protocols = [x.strip() for x in args.alpn.split(",") if x.strip()]
+    if args.verbose is not None:
+        verbose = args.verbose
+    verboseprint = print if verbose else lambda *a, **k: None
+
+    raise_file_limit(args.concurrency)
+    context = create_context(alpn_protocols)
+    counts = {'handshakes': 0, 'errors': 0}
+
+    with open(args.output_file, 'w', newline='') as csv_fd:
+        csv_writer = csv.DictWriter(csv_fd, fieldnames=FIELD_NAMES)
+        csv_writer.writeheader()
+
+        def write_result(result):
+            if result['error']:
+                counts['errors'] += 1
+                verboseprint("[-] %s:%s %s" % (result['host'], result['port'], result['error']))
+            else:
+                counts['handshakes'] += 1
+                verboseprint("[*] %s:%s %s %s" % (result['host'], result['port'],
+                                                  result['tls_version'], result['subject']))
+            csv_writer.writerow(result)
+
+        targets = read_targets(args.host_directory, ports)
+        asyncio.run(probe_all(targets, context, args.concurrency, args.timeout, write_result))
+
+    print("[*] %d TLS handshakes completed, %d failed" % (counts['handshakes'], counts['errors']))
+
+
+if __name__ == "__main__":
+    main()
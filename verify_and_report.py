@@ -1,137 +1,911 @@
 #!/usr/bin/env python3
 #
-# Takes a masscan report and
+# Takes a masscan report (list, binary, JSON or XML) or
+# nmap greppable or XML output and
 # grabs banners from open services
 # using nmap. Then produces a report
 # of services. The report is stored
 # in CSV format and placed in the 
 # output directory.
 #
+# Rows are added to the report as each nmap run finishes.
+# Once every run has finished the report is rewritten sorted
+# by IP address and port, with one row per host and port.
+# The nmap runs share <max packets per second> between them.
+# When runs finish and nothing is queued, the runs still
+# going are restarted on their remaining hosts at a higher
+# --max-rate, so the total rate stays at the maximum.
+#
 # Usage: 
 # verify_and_report.py [OPTIONS] <scan file> <num concurrent scans> <max packets per second>
 # OPTIONS:
 #   -x, --exclude <comma separated list of ports>   exclude the list of ports from service detection
 #   -v, --verbose                                   provide verbose output
+#   -j, --jobs <n>                                  parse the scan file in parallel with n processes
+#   -c, --chunk-size <n>                            split host files into nmap runs of at most n hosts,
+#                                                   the default spreads the hosts over 4 runs per scan
+#   -g, --group-ports                               scan every port open on a host in one nmap run, hosts
+#                                                   with the same open ports share a run
+#   --cache <file>, --max-age <days>, --refresh     skip hosts with a service detection result cached in the
+#                                                   SQLite file in the last <days> (default 7), --refresh probes
+#                                                   them anyway
+#   --native                                        identify common services in-process with the rules in
+#                                                   service_probes.txt (or --probes-file), only the ports
+#                                                   they cannot identify are probed with nmap
+#   --native-concurrency <n>, --native-timeout <seconds>
+#                                                   connections in flight (default 500), connect deadline (default 5)
+#   -t, --tiered                                    probe at --light-intensity (default 2) first and only the open
+#                                                   ports left unidentified or tcpwrapped again at
+#                                                   --escalate-intensity (default 9)
+#   --resume                                        pick up an interrupted run from the job manifest
+#                                                   (manifest.json) in its output directory, only the
+#                                                   unfinished nmap runs are started again
+#   -T, --job-timeout <seconds>                     kill nmap runs that take longer and queue their unfinished
+#                                                   hosts again, up to --retries times (default 2)
+#   --status-interval, --metrics-prom, --metrics-json
+#                                                   live status line, Prometheus textfile and JSON summary
+#   --profile <file>, --profile-cprofile <file>     per-stage timings and peak memory as JSON, cProfile dump
 #
 
 import argparse
+import asyncio
 import csv
-import ipaddress
-import multiprocessing
+import heapq
 import os
-import subprocess
+import re
 import sys
+import time
+from contextlib import nullcontext
 
+from host_writer import HostFileWriter, PortHostSets, host_sort_key
+from scan_host_list import parse_parallel
+from scan_readers import LINE_FORMATS, detect_format, parse_gnmap_line, read_records
+from scan_metrics import add_metrics_arguments, metrics_from_args
+from scan_profiling import add_profile_arguments, profiler_from_args
+from service_cache import add_cache_arguments, cache_from_args
+from job_manifest import DONE, FAILED, PENDING, RUNNING, JobManifest
+from service_probe import add_native_arguments, prober_from_args
 
-def host_output(output_directory, proto, port, host):
-    """Write a host to an output file."""
-    output_file = os.path.join(output_directory, "%s_%s.txt" % (proto, port))
-
-    # write the host to the output file
-    with open(output_file, 'a') as host_fd:
-        host_fd.write("%s\n" % host)
-
-
-def parse_scan_file(scan_file, output_directory, exclude_ports, verboseprint):
-    """Parses the initial scan file."""
-    with open(scan_file, 'r') as scan_fd:
-        for i, line in enumerate(scan_fd):
-            # read the header line to determine the file type
-            if i == 0:
-                if "#masscan" in line:
-                    file_type = "masscan"
-                elif "# Nmap" in line:
-                    file_type = "nmap"
-                else:
-                    assert False, "file type unknown"
-                verboseprint("[*] file type is %s" % file_type)
-            port_info = parse_line(line, file_type, verboseprint)  # returns [[state, proto, port, host, banner],]
-            for p in port_info:
-                if p[0] == "open" and p[2] not in exclude_ports:
-                    host_output(output_directory, p[1], p[2], p[3])
-
-
-def produce_report(output_directory, report_file, verboseprint):
-    """Generates the report."""
-    verboseprint("[*] entering produce_report function")
-    file_list = os.listdir(output_directory)
-    service_detection_files = [os.path.join(output_directory, x) for x in file_list if "service_detection" in x]
-    
-    with open(report_file, 'w') as csv_fd:
+# nmap runs are not split any smaller than this
+MIN_CHUNK_SIZE = 64
+# hosts sharing a set of open ports are grouped into one nmap run if there are at least this many
+MIN_GROUP_SIZE = 16
+# running nmap jobs with fewer hosts left than this are not relaunched at a higher rate
+MIN_RELAUNCH_HOSTS = 16
+# seconds between checks whether the rate of finished jobs can go to the running ones
+REBALANCE_INTERVAL = 5
+# most report runs merged in one pass, more are merged in several passes
+MAX_MERGE_RUNS = 128
+REPORT_FIELDS = ['host', 'protocol', 'port', 'state', 'service_info']
+NMAP_DONE = re.compile(r'# Nmap done at (.*) -- (\d+) IP address(?:es)? \((\d+) hosts? up\) scanned in ([\d.]+) seconds')
+
+
+def parse_scan_file(scan_file, output_directory, exclude_ports, verboseprint, metrics, jobs=1):
+    """Parses the initial scan file into one sorted, unique host file per protocol/port."""
+    host_sets = PortHostSets(os.path.join(output_directory, ".spill"))
+    file_type = detect_format(scan_file)
+    verboseprint("[*] file type is %s" % file_type)
+    if jobs > 1 and file_type in LINE_FORMATS:
+        verboseprint("[*] parsing with %d processes" % jobs)
+        parse_parallel(scan_file, file_type, jobs, host_sets, exclude_ports, metrics)
+    else:
+        for state, proto, port, host, _ in read_records(scan_file, file_type):
+            if state == "open" and port not in exclude_ports:
+                host_sets.add(proto, port, host)
+                metrics.inc("open")
+            metrics.inc("records")
+            metrics.update()
+
+    with HostFileWriter(output_directory) as writer:
+        host_sets.write_files(writer)
+
+
+class ServiceReport:
+    """The CSV report of the service detection results. Rows are appended through
+    one buffered writer as each nmap run finishes and flushed after every run, so
+    the rows of the finished runs are on disk even if the script does not finish.
+
+    Each batch of rows is also written, sorted, to a run file under report_runs.
+    finish() merges the runs into the final report, sorted by IP address and
+    port with one row per host, protocol and port, in bounded memory."""
+
+    def __init__(self, report_file, verboseprint, metrics, cache=None, append=False):
+        self.report_file = report_file
+        self.verboseprint = verboseprint
+        self.metrics = metrics
+        self.cache = cache
+        # while hold is set, unidentified open ports are left out for a second probe
+        self.hold = False
+        self.run_directory = os.path.join(os.path.dirname(report_file), "report_runs")
+        os.makedirs(self.run_directory, exist_ok=True)
+        self.runs = sorted(os.path.join(self.run_directory, x) for x in os.listdir(self.run_directory)
+                           if x.startswith("run_") and x.endswith(".csv"))
+        append = append and os.path.isfile(report_file) and os.path.getsize(report_file) > 0
+        self.csv_fd = open(report_file, 'a' if append else 'w', buffering=1024 * 1024)
+        self.csvwriter = csv.writer(self.csv_fd, dialect='excel')
+        if not append:
+            self.csvwriter.writerow(REPORT_FIELDS)
+        self.csv_fd.flush()
+
+    def add_gnmap(self, gnmap_file):
+        """Appends the ports in a nmap greppable output file to the report."""
+        if not os.path.isfile(gnmap_file):
+            return
+        rows = []
+        with open(gnmap_file, 'r') as gnmap_fd:
+            for line in gnmap_fd:
+                # skip the unfinished last line of a run that was stopped
+                if not line.strip() or not line.endswith("\n"):
+                    continue
+                for p in parse_gnmap_line(line):
+                    if not (self.hold and p[0] == "open" and unidentified(p[5])):
+                        rows.append((p[3], p[1], p[2], p[0], p[4], p[5]))
+        self.add_results(rows)
+
+    def add_results(self, rows, store=True):
+        """Appends (host, protocol, port, state, service_info, service) detection results,
+        flushes them and, with store, stores them in the cache."""
+        if not rows:
+            return
+        for row in rows:
+            self.add_row(row[:5])
+        self.csv_fd.flush()
+        self.add_run(sorted((row[:5] for row in rows), key=row_sort_key))
+        if store and self.cache is not None:
+            self.cache.store(rows)
+
+    def add_row(self, row):
+        """Appends a host, protocol, port, state, service_info row."""
+        self.csvwriter.writerow(row)
+        self.metrics.inc("report_rows")
+
+    def add_run(self, rows):
+        """Writes sorted rows to the next run file."""
+        path = os.path.join(self.run_directory, "run_%06d.csv" % (len(self.runs) + 1))
+        write_rows(path + ".tmp", rows)
+        os.replace(path + ".tmp", path)
+        self.runs.append(path)
+
+    def finish(self):
+        """Replaces the report with the merge of the runs: sorted by IP address,
+        then port and protocol, keeping the latest row for each host, protocol and port."""
+        self.csv_fd.close()
+        runs = self.runs
+        # merge in passes so no more than MAX_MERGE_RUNS files are open at a time
+        level = 0
+        while len(runs) > MAX_MERGE_RUNS:
+            level += 1
+            merged = []
+            for i in range(0, len(runs), MAX_MERGE_RUNS):
+                path = os.path.join(self.run_directory, "merge_%d_%06d.csv" % (level, i // MAX_MERGE_RUNS + 1))
+                write_rows(path, merge_runs(runs[i:i + MAX_MERGE_RUNS]))
+                merged.append(path)
+            for path in runs:
+                if os.path.basename(path).startswith("merge_"):
+                    os.remove(path)
+            runs = merged
+        num_rows = write_rows(self.report_file + ".tmp", merge_runs(runs), header=True)
+        os.replace(self.report_file + ".tmp", self.report_file)
+        self.verboseprint("[*] %d unique rows in %s" % (num_rows, self.report_file))
+        for path in set(runs) | set(self.runs):
+            os.remove(path)
+        self.runs = []
+        os.rmdir(self.run_directory)
+
+    def close(self):
+        self.csv_fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def row_sort_key(row):
+    """sort key of a report row: IP address in numeric order, port, protocol"""
+    return host_sort_key(row[0]), int(row[2]), row[1]
+
+
+def write_rows(path, rows, header=False):
+    """Writes report rows to a CSV file, returns the number of rows written."""
+    num_rows = 0
+    with open(path, 'w', newline='', buffering=1024 * 1024) as csv_fd:
         csvwriter = csv.writer(csv_fd, dialect='excel')
-        csvwriter.writerow(['host', 'protocol', 'port', 'state', 'service_info'])
-        for s in service_detection_files:
-            with open(s, 'r') as s_fd:
-                for line in s_fd.readlines():
-                    port_info = parse_line(line, "nmap", verboseprint)
-                    if len(port_info) > 0:
-                        #print("line = %s, port_info = %s" % (line, port_info))
-                        csvwriter.writerow([port_info[3], port_info[1], port_info[2], port_info[0], port_info[4]])
-
-
-def parse_line(line, file_type, verboseprint):
-    """Parse a scan file line, returns state, proto, port, host, banner."""
-    result = []
-    if line[0] == "#":
+        if header:
+            csvwriter.writerow(REPORT_FIELDS)
+        for row in rows:
+            csvwriter.writerow(row)
+            num_rows += 1
+    return num_rows
+
+
+def read_rows(path):
+    with open(path, 'r', newline='', buffering=1024 * 1024) as csv_fd:
+        yield from csv.reader(csv_fd, dialect='excel')
+
+
+def merge_runs(paths):
+    """Yields the rows of sorted run files in order, once per host, protocol and port.
+    A row from a later run replaces the rows before it."""
+    previous = None
+    for row in heapq.merge(*(read_rows(path) for path in paths), key=row_sort_key):
+        if previous is not None and previous[:3] != row[:3]:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+
+def unidentified(service):
+    """True for a service nmap did not identify: blank, unknown, only guessed
+    from the port number (a trailing ?) or tcpwrapped. The SSL prefix is
+    "ssl|", greppable output and the native probe results write "/" as "|"."""
+    if service.startswith("ssl|"):
+        service = service[4:]
+    return service in ("", "unknown", "tcpwrapped") or service.endswith("?")
+
+
+def gnmap_results(directory):
+    """returns {(host, protocol, port): (host, protocol, port, state, service_info, service)}
+    for the complete lines of the service_detection_*.gnmap files in directory"""
+    results = {}
+    for x in sorted(os.listdir(directory)):
+        if not x.startswith("service_detection_") or not x.endswith(".gnmap"):
+            continue
+        with open(os.path.join(directory, x), 'r') as gnmap_fd:
+            for line in gnmap_fd:
+                if "Ports:" not in line or not line.endswith("\n"):
+                    continue
+                for p in parse_gnmap_line(line):
+                    results[(p[3], p[1], p[2])] = (p[3], p[1], p[2], p[0], p[4], p[5])
+    return results
+
+
+def write_escalated(directory, held):
+    """Writes the hosts of the held results to one host file per protocol/port
+    in directory, returns the number of hosts written."""
+    port_hosts = {}
+    for host, protocol, port in held:
+        port_hosts.setdefault((protocol, port), []).append(host)
+    os.makedirs(directory, exist_ok=True)
+    for (protocol, port), hosts in port_hosts.items():
+        with open(os.path.join(directory, "%s_%s.txt" % (protocol, port)), 'w') as host_fd:
+            host_fd.writelines("%s\n" % h for h in sorted(hosts, key=host_sort_key))
+    return len(held)
+
+
+def rewrite_host_file(host_file, hosts):
+    """Replaces the hosts in a host file, removes the file if none are left."""
+    if hosts:
+        with open(host_file + ".tmp", 'w') as host_fd:
+            host_fd.writelines("%s\n" % h for h in hosts)
+        os.replace(host_file + ".tmp", host_file)
+    else:
+        os.remove(host_file)
+
+
+def apply_cache(output_directory, cache, report, verboseprint, metrics):
+    """Removes the hosts with a fresh cached result from the host files and
+    adds their cached results to the report instead."""
+    for x in sorted(os.listdir(output_directory)):
+        name, ext = os.path.splitext(x)
+        if ext != ".txt" or name.split("_")[0] not in ["tcp", "udp"]:
+            continue
+        protocol, port = name.split("_")
+        cached = cache.fresh(protocol, port)
+        if not cached:
+            continue
+
+        host_file = os.path.join(output_directory, x)
+        with open(host_file, 'r') as host_fd:
+            hosts = [line.strip() for line in host_fd if line.strip()]
+        probe = []
+        rows = []
+        for host in hosts:
+            if host in cached:
+                state, service_info = cached[host]
+                rows.append((host, protocol, port, state, service_info, ""))
+                metrics.inc("cache_hits")
+            else:
+                probe.append(host)
+        verboseprint("[*] %s/%s: %d of %d hosts cached" % (protocol, port, len(hosts) - len(probe), len(hosts)))
+        report.add_results(rows, store=False)
+        rewrite_host_file(host_file, probe)
+
+
+def probe_native(output_directory, prober, report, verboseprint, metrics):
+    """Identifies the services on the TCP ports the native probe rules cover in-process,
+    adds them to the report and removes their hosts from the host files, so nmap only
+    probes the hosts the rules could not identify."""
+    ports = prober.rules.ports()
+    host_files = {}
+    targets = []
+    for x in sorted(os.listdir(output_directory)):
+        name, ext = os.path.splitext(x)
+        if ext != ".txt" or not name.startswith("tcp_") or name.split("_")[1] not in ports:
+            continue
+        port = name.split("_")[1]
+        host_file = os.path.join(output_directory, x)
+        with open(host_file, 'r') as host_fd:
+            hosts = [line.strip() for line in host_fd if line.strip()]
+        host_files[port] = (host_file, hosts)
+        targets.extend((host, port) for host in hosts)
+    verboseprint("[*] probing %d hosts on %d ports natively" % (len(targets), len(host_files)))
+
+    identified = set()
+    rows = []
+
+    def add_result(host, port, result):
+        metrics.inc("native_probes")
+        if result is not None:
+            service, service_info = result
+            identified.add((host, port))
+            rows.append((host, "tcp", port, "open", service_info, service))
+            metrics.inc("native_identified")
+            if len(rows) >= 256:
+                report.add_results(rows)
+                rows.clear()
+        metrics.update()
+
+    try:
+        asyncio.run(prober.probe_all(targets, add_result))
+    finally:
+        report.add_results(rows)
+    for port, (host_file, hosts) in host_files.items():
+        remaining = [host for host in hosts if (host, port) not in identified]
+        verboseprint("[*] tcp/%s: %d of %d hosts identified natively" % (port, len(hosts) - len(remaining), len(hosts)))
+        rewrite_host_file(host_file, remaining)
+
+
+def count_hosts(host_file):
+    with open(host_file, 'r') as host_fd:
+        return sum(1 for line in host_fd if line.strip())
+
+
+class ProbeJob:
+    """One nmap run over a host file for protocol/port. port may be a
+    comma separated list, label then names the output of the run."""
+
+    def __init__(self, protocol, port, host_file, output_file, num_hosts, label=None):
+        self.protocol = protocol
+        self.port = port
+        self.label = label if label is not None else port
+        self.host_file = host_file
+        self.output_file = output_file
+        self.num_hosts = num_hosts
+        # relaunched runs are named after the first one
+        self.base = os.path.splitext(os.path.basename(host_file))[0]
+        self.pps = 0
+        self.process = None
+        self.start = None
+        self.relaunches = 0
+        self.relaunch_pps = None
+        self.attempts = 0
+
+    def key(self):
+        return self.protocol, self.label
+
+    def fields(self):
+        """returns the attributes recorded in the job manifest"""
+        return {"protocol": self.protocol, "port": self.port, "label": self.label, "host_file": self.host_file,
+                "output_file": self.output_file, "num_hosts": self.num_hosts, "base": self.base,
+                "relaunches": self.relaunches, "attempts": self.attempts}
+
+    @classmethod
+    def from_fields(cls, fields):
+        job = cls(fields["protocol"], fields["port"], fields["host_file"], fields["output_file"],
+                  fields["num_hosts"], fields["label"])
+        job.base = fields["base"]
+        job.relaunches = fields["relaunches"]
+        job.attempts = fields["attempts"]
+        return job
+
+    def name(self):
+        return os.path.splitext(os.path.basename(self.host_file))[0]
+
+
+def group_hosts(host_files):
+    """Groups the hosts by protocol and the exact set of ports open on them,
+    returns a list of (protocol, ports, hosts)."""
+    open_ports = {}
+    for protocol, port, host_file, _ in host_files:
+        with open(host_file, 'r') as host_fd:
+            for line in host_fd:
+                host = line.strip()
+                if host:
+                    open_ports.setdefault((protocol, host), []).append(port)
+
+    groups = {}
+    for (protocol, host), ports in open_ports.items():
+        groups.setdefault((protocol, tuple(sorted(ports, key=int))), []).append(host)
+    return [(protocol, ports, sorted(hosts, key=host_sort_key))
+            for (protocol, ports), hosts in sorted(groups.items(), key=lambda x: (x[0][0], [int(p) for p in x[0][1]]))]
+
+
+def chunk_jobs(output_directory, protocol, port, label, hosts, chunk_size):
+    """Writes hosts to host files of at most chunk_size hosts and returns a job for each."""
+    chunk_directory = os.path.join(output_directory, "chunks")
+    os.makedirs(chunk_directory, exist_ok=True)
+    if len(hosts) <= chunk_size:
+        host_file = os.path.join(chunk_directory, "%s_%s.txt" % (protocol, label))
+        with open(host_file, 'w') as host_fd:
+            host_fd.writelines("%s\n" % h for h in hosts)
+        output_file = os.path.join(output_directory, "service_detection_%s_%s.gnmap" % (protocol, label))
+        return [ProbeJob(protocol, port, host_file, output_file, len(hosts), label)]
+
+    jobs = []
+    for i in range(0, len(hosts), chunk_size):
+        name = "%s_%s_%04d" % (protocol, label, i // chunk_size + 1)
+        chunk_file = os.path.join(chunk_directory, name + ".txt")
+        with open(chunk_file, 'w') as chunk_fd:
+            chunk_fd.writelines("%s\n" % h for h in hosts[i:i + chunk_size])
+        chunk_output = os.path.join(chunk_directory, "service_detection_%s.gnmap" % name)
+        jobs.append(ProbeJob(protocol, port, chunk_file, chunk_output, len(hosts[i:i + chunk_size]), label))
+    return jobs
+
+
+def plan_jobs(output_directory, num_scans, chunk_size=0, group_ports=False):
+    """Splits the host files into chunks of at most chunk_size hosts and returns
+    the probe jobs largest first, so the long nmap runs start before the short ones.
+    With group_ports there is one job for every group of hosts with the same open
+    ports instead of one for every port, each scanning all the ports of its group."""
+    host_files = []
+    for x in sorted(os.listdir(output_directory)):
+        name, ext = os.path.splitext(x)
+        protocol = name.split("_")[0]
+        if ext == ".txt" and protocol in ["tcp", "udp"]:
+            host_file = os.path.join(output_directory, x)
+            host_files.append((protocol, name.split("_")[1], host_file, count_hosts(host_file)))
+
+    if group_ports:
+        groups = group_hosts(host_files)
+        total_hosts = sum(len(hosts) for _, _, hosts in groups)
+    else:
+        total_hosts = sum(x[3] for x in host_files)
+    if chunk_size <= 0:
+        chunk_size = max(MIN_CHUNK_SIZE, -(-total_hosts // (num_scans * 4)))
+
+    jobs = []
+    if group_ports:
+        # single port groups and groups too small to be worth their own
+        # nmap run are scanned one port at a time like without group_ports
+        per_port = {}
+        for i, (protocol, ports, hosts) in enumerate(groups):
+            if len(ports) == 1 or len(hosts) < MIN_GROUP_SIZE:
+                for port in ports:
+                    per_port.setdefault((protocol, port), []).extend(hosts)
+                continue
+            jobs.extend(chunk_jobs(output_directory, protocol, ",".join(ports), "group%04d" % (i + 1),
+                                   hosts, chunk_size))
+        for (protocol, port), hosts in per_port.items():
+            jobs.extend(chunk_jobs(output_directory, protocol, port, port, sorted(hosts, key=host_sort_key),
+                                   chunk_size))
+    else:
+        for protocol, port, host_file, num_hosts in host_files:
+            if num_hosts <= chunk_size:
+                output_file = os.path.join(output_directory, "service_detection_%s_%s.gnmap" % (protocol, port))
+                jobs.append(ProbeJob(protocol, port, host_file, output_file, num_hosts))
+                continue
+            with open(host_file, 'r') as host_fd:
+                hosts = [line.strip() for line in host_fd if line.strip()]
+            jobs.extend(chunk_jobs(output_directory, protocol, port, port, hosts, chunk_size))
+
+    jobs.sort(key=lambda x: x.num_hosts, reverse=True)
+    return jobs, chunk_size
+
+
+def merge_gnmap(chunk_outputs, output_file):
+    """Merges the greppable output of the nmap runs for one port into output_file,
+    keeping the first header and adding up the host counts of the "Nmap done" lines.
+    Runs that were stopped early have no "Nmap done" line and may end in a partial line."""
+    header = None
+    done = None
+    addresses = hosts_up = 0
+    seconds = 0.0
+    # the merged file only appears once complete, a resumed run relies on that
+    with open(output_file + ".tmp", 'w') as output_fd:
+        for chunk_output in chunk_outputs:
+            if not os.path.isfile(chunk_output):
+                print("[-] missing nmap output %s" % chunk_output)
+                continue
+            hosts = set()
+            finished = False
+            with open(chunk_output, 'r') as chunk_fd:
+                for line in chunk_fd:
+                    match = NMAP_DONE.match(line)
+                    if match:
+                        finished = True
+                        done = match.group(1)
+                        addresses += int(match.group(2))
+                        hosts_up += int(match.group(3))
+                        seconds = max(seconds, float(match.group(4)))
+                    elif line.startswith("#"):
+                        if header is None:
+                            header = line
+                            output_fd.write(line)
+                    elif line.endswith("\n"):
+                        output_fd.write(line)
+                        if "Ports:" in line:
+                            hosts.add(line.split()[1])
+            if not finished:
+                # a stopped run only counts the hosts it reported
+                addresses += len(hosts)
+                hosts_up += len(hosts)
+        if done is not None:
+            output_fd.write("# Nmap done at %s -- %d IP addresses (%d hosts up) scanned in %.2f seconds\n" %
+                            (done, addresses, hosts_up, seconds))
+    os.replace(output_file + ".tmp", output_file)
+    for chunk_output in chunk_outputs:
+        if os.path.isfile(chunk_output):
+            os.remove(chunk_output)
+
+
+def gnmap_complete(gnmap_file):
+    """True if a greppable output file ends with nmap's "Nmap done" line"""
+    last = ""
+    with open(gnmap_file, 'r') as gnmap_fd:
+        for line in gnmap_fd:
+            last = line
+    return NMAP_DONE.match(last) is not None
+
+
+def completed_hosts(gnmap_file):
+    """returns the hosts with a complete Ports line in a greppable output file that may still be written to"""
+    hosts = set()
+    if os.path.isfile(gnmap_file):
+        with open(gnmap_file, 'r') as gnmap_fd:
+            for line in gnmap_fd:
+                if line.startswith("Host:") and "Ports:" in line and line.endswith("\n"):
+                    hosts.add(line.split()[1])
+    return hosts
+
+
+def nmap_command(protocol, port, pps, host_file, output_file, intensity=None):
+    # determine the scan type
+    if protocol == "tcp":
+        scan_type = ""  # nmap defaults to a TCP scan
+    else:
+        scan_type = "-sU"
+    if intensity is not None:
+        scan_type += " --version-intensity %d" % intensity
+    return "nmap %s -Pn -p%s --max-rate %s -sV -iL %s -oG %s" % (scan_type, port, pps, host_file, output_file)
+
+
+class ProbeSupervisor:
+    """Runs the probe jobs as nmap child processes under asyncio, at most
+    num_scans at a time, while keeping the sum of their --max-rate at or
+    below max_pps.
+
+    A job gets its share of max_pps when it starts. nmap cannot change its rate
+    while running, so once nothing is waiting and jobs finish, every running job
+    whose share would at least double is stopped and relaunched at the new rate
+    on the hosts it has not finished yet. A run that takes longer than
+    job_timeout seconds is killed and the hosts it has not finished are queued
+    again, up to retries times. With intensity set nmap runs with that
+    --version-intensity instead of its default. Each change of a job's state
+    is recorded in manifest under stage, states and outputs pick up the
+    jobs of an interrupted run from it. The outputs of all the runs for a port are
+    merged into service_detection_<proto>_<port>.gnmap."""
+
+    def __init__(self, jobs, num_scans, max_pps, output_directory, metrics, verboseprint,
+                 job_timeout=0, retries=2, report=None, intensity=None, manifest=None, stage="probe",
+                 states=None, outputs=None):
+        self.jobs = jobs
+        self.intensity = intensity
+        self.manifest = manifest
+        self.stage = stage
+        self.states = states
+        self.report = report
+        self.num_scans = max(1, num_scans)
+        self.max_pps = max_pps
+        self.output_directory = output_directory
+        self.chunk_directory = os.path.join(output_directory, "chunks")
+        self.metrics = metrics
+        self.verboseprint = verboseprint
+        self.job_timeout = job_timeout
+        self.retries = retries
+        self.semaphore = None
+        self.waiting = 0
+        self.running = []
+        self.tasks = set()
+        self.processes = set()
+        self.outputs = {}
+        self.remaining = {}
+        # ports whose outputs were merged before the run was interrupted
+        self.merged = set()
+        # running jobs rebalance() skipped because their run had not finished a host yet
+        self.deferred = set()
+        for job in jobs:
+            self.outputs.setdefault(job.key(), []).append(job.output_file)
+            self.remaining[job.key()] = self.remaining.get(job.key(), 0) + 1
+        if outputs is not None:
+            self.outputs.update(outputs)
+
+    def record(self, job, state, save=True):
+        """Records the state of job and its current files in the manifest."""
+        if self.manifest is None:
+            return
+        fields = job.fields()
+        fields["state"] = state
+        fields["returncode"] = job.process.returncode if job.process is not None else None
+        key = job.key()
+        self.manifest.set_job(self.stage, job.base, fields, "%s_%s" % key, self.outputs[key], save)
+
+    def resume(self):
+        """Queues the jobs an interrupted run did not finish. The hosts a stopped
+        job finished are reported and the job runs again on the rest."""
+        for key, outputs in self.outputs.items():
+            final_output = self.final_output(key)
+            if outputs != [final_output] and os.path.isfile(final_output):
+                self.merged.add(key)
+        for job in self.jobs:
+            state = self.states.get(job.base, PENDING)
+            if state == DONE:
+                # a done job's output is complete or already merged
+                if os.path.isfile(job.output_file) and gnmap_complete(job.output_file) or \
+                        job.key() in self.merged:
+                    self.finished(job)
+                    continue
+                print("[-] %s is incomplete, probing its unfinished hosts again" % job.output_file)
+            if state == RUNNING and self.report is not None:
+                # the run was stopped before its results were reported
+                self.report.add_gnmap(job.output_file)
+            job.attempts = 0
+            if state != PENDING and os.path.isfile(job.output_file) and self.restart_remaining(job) == 0:
+                self.record(job, DONE)
+                self.finished(job)
+                continue
+            self.record(job, PENDING)
+            self.submit(job)
+
+    def share(self, num_jobs):
+        """returns the rate of each of num_jobs jobs splitting max_pps"""
+        return max(1, self.max_pps // max(1, min(self.num_scans, num_jobs)))
+
+    def final_output(self, key):
+        return os.path.join(self.output_directory, "service_detection_%s_%s.gnmap" % key)
+
+    def submit(self, job):
+        """Queues job, the semaphore hands out the slots in the order the jobs were queued."""
+        self.waiting += 1
+        task = asyncio.ensure_future(self.probe(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def restart_remaining(self, job):
+        """Points job at a new host file with the hosts that have no output yet,
+        returns the number of hosts left."""
+        done = completed_hosts(job.output_file)
+        with open(job.host_file, 'r') as host_fd:
+            hosts = [line for line in host_fd if line.strip() and line.strip() not in done]
+
+        key = job.key()
+        os.makedirs(self.chunk_directory, exist_ok=True)
+        if job.output_file == self.final_output(key):
+            # the partial output is merged with the later runs at the end
+            partial_output = os.path.join(self.chunk_directory, "service_detection_%s.gnmap" % job.name())
+            if os.path.isfile(job.output_file):
+                os.replace(job.output_file, partial_output)
+                self.outputs[key] = [partial_output]
+            else:
+                self.outputs[key] = []
+        elif not os.path.isfile(job.output_file):
+            # a run stopped before nmap wrote anything has nothing to merge
+            self.outputs[key].remove(job.output_file)
+        if not hosts:
+            return 0
+
+        job.relaunches += 1
+        name = "%s_r%d" % (job.base, job.relaunches)
+        job.host_file = os.path.join(self.chunk_directory, name + ".txt")
+        job.output_file = os.path.join(self.chunk_directory, "service_detection_%s.gnmap" % name)
+        job.num_hosts = len(hosts)
+        with open(job.host_file, 'w') as host_fd:
+            host_fd.writelines(hosts)
+        self.outputs[key].append(job.output_file)
+        return len(hosts)
+
+    async def stream(self, reader, job, is_stderr):
+        """Prints the output of a nmap run line by line as it is written."""
+        first = True
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode('ascii', errors='replace').rstrip()
+            if is_stderr:
+                if first:
+                    print("[-] ERROR in nmap command %s" % nmap_command(job.protocol, job.port, job.pps,
+                                                                        job.host_file, job.output_file,
+                                                                        self.intensity))
+                    first = False
+                print("[-] %s: %s" % (job.name(), line))
+            elif line:
+                self.verboseprint("[*] %s: %s" % (job.name(), line))
+
+    async def run_nmap(self, job, pps):
+        """Runs nmap for job at pps, returns "done", "relaunch" or "timeout"."""
+        job.pps = pps
+        job.relaunch_pps = None
+        job.process = None
+        command = nmap_command(job.protocol, job.port, pps, job.host_file, job.output_file, self.intensity)
+        print("[*] initiating service detection for %s/%s (%s)" % (job.protocol.upper(), job.port, job.name()))
+        print(command)
+        job.process = await asyncio.create_subprocess_exec(*command.split(), stdin=asyncio.subprocess.DEVNULL,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE)
+        self.processes.add(job.process)
+        self.record(job, RUNNING)
+        try:
+            await asyncio.wait_for(asyncio.gather(self.stream(job.process.stdout, job, False),
+                                                  self.stream(job.process.stderr, job, True),
+                                                  job.process.wait()),
+                                   self.job_timeout or None)
+        except asyncio.TimeoutError:
+            print("[-] %s timed out after %g seconds, killing nmap" % (job.name(), self.job_timeout))
+            job.process.kill()
+            await job.process.wait()
+            result = "timeout"
+        else:
+            result = "relaunch" if job.relaunch_pps is not None else "done"
+        finally:
+            if job.process.returncode is not None:
+                self.processes.discard(job.process)
+
+        # a stopped run reports the hosts it finished, the rest go to the next run
+        if self.report is not None:
+            self.report.add_gnmap(job.output_file)
         return result
 
-    if file_type == "masscan":
-        state, proto, port, host, _ = line.split()
-        result = ["open", proto, port, host, ""]
-    elif file_type == "nmap":
-        # Ignore these lines:
-        # Host: 10.1.1.1 ()   Status: Up
-        if "Status:" not in line:
-            # Host: 10.1.1.1 ()   Ports: 21/filtered/tcp//ftp///, 80/open/tcp//http///,
-            # 53/open|filtered/udp//domain///, 137/open/udp//netbios-ns///  Ignored State: filtered (195)
-            # Ports: 25/open/tcp//smtp//Microsoft Exchange smtpd/
-            host_info, port_info = line.split("Ports:")
-            host = host_info.strip().split(' ')[1]
-
-            # get the port information
-            port_info = port_info.strip()
-            if "Ignored State" in port_info:
-                port_info, _ = port_info.split('Ignored State:')
-            port_info = port_info.strip()
-            port_list = port_info.split(',')
-            port_list = [ x.strip() for x in port_list ]
-            for p in port_list:
-                try:
-                    port, state, proto, _, _, _, banner, _ = p.split('/')
-                    result.append([state, proto, port, host, banner])
-                except ValueError as err:
-                    print("[-] Error occurred: %s" % str(err))
-                    print("[-] offending line: %s" % p)
-
-    verboseprint("[*] parse line result: %s" % result)
-    return result
-
-
-def probe_service(args):
-    """Probes all hosts given the host file, which has the naming convention <protocol>_<port>.txt"""
-    pps = args[0]
-    host_file = args[1]
-    host_file_name = os.path.basename(host_file)
-    host_file_dir = os.path.dirname(host_file)
-    protocol, port = host_file_name.split(".")[0].split("_")
-    #print("host_file_name = %s, protocol = %s, port = %s" % (host_file_name, protocol, port))
-
-    if protocol in ["tcp", "udp"]:
-        output_file = os.path.join(host_file_dir, "service_detection_%s_%s.gnmap" % (protocol, port))
-
-        # determine the scan type and run it
-        if protocol == "tcp":
-            scan_type = ""  # nmap defaults to a TCP scan
+    async def probe(self, job):
+        async with self.semaphore:
+            self.waiting -= 1
+            if job.start is None:
+                job.start = time.monotonic()
+            self.running.append(job)
+            self.update()
+            try:
+                result = await self.run_nmap(job, self.share(len(self.running) + self.waiting))
+                while result == "relaunch":
+                    pps = job.relaunch_pps
+                    if self.restart_remaining(job) == 0:
+                        result = "done"
+                        break
+                    self.metrics.inc("relaunches")
+                    self.verboseprint("[*] relaunching %s/%s at %d pps for %d hosts" %
+                                      (job.protocol, job.port, pps, job.num_hosts))
+                    result = await self.run_nmap(job, pps)
+            finally:
+                self.running.remove(job)
+
+        if result == "timeout":
+            self.metrics.inc("timeouts")
+            job.attempts += 1
+            if job.attempts <= self.retries and self.restart_remaining(job) > 0:
+                self.metrics.inc("requeued")
+                print("[*] queueing the %d unfinished %s/%s hosts again" % (job.num_hosts, job.protocol, job.port))
+                self.record(job, PENDING)
+                self.submit(job)
+                return
+            print("[-] giving up on %s after %d attempts" % (job.host_file, job.attempts))
+            self.metrics.inc("failed_jobs")
+            self.record(job, FAILED)
         else:
-            scan_type = "-sU"
-        nmap_command = "nmap %s -Pn -p%s --max-rate %s -sV -iL %s -oG %s" % (scan_type, port, pps, host_file, output_file)
-        print("[*] initiating service detection for %s/%s" % (protocol.upper(), port))
-        print(nmap_command)
-        nmap_command = nmap_command.split()
-        result = subprocess.run(nmap_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if len(result.stderr) > 0:
-            print("[-] ERROR in nmap command %s" % nmap_command)
-            print("[-] %s" % result.stderr.decode('ascii'))
+            self.record(job, DONE)
+        self.finished(job)
+        self.rebalance()
+
+    def rebalance(self):
+        """Hands the rate of the finished jobs to the running ones once nothing is waiting."""
+        self.deferred = set()
+        if self.waiting or not self.running:
+            return
+        pps = self.share(len(self.running))
+        for job in self.running:
+            if job.process is None or job.process.returncode is not None:
+                continue
+            if pps < 2 * job.pps or job.relaunch_pps is not None:
+                continue
+            done = completed_hosts(job.output_file)
+            if not done:
+                # relaunching a run that has not finished a host would only restart it,
+                # report_status() looks at it again once it has
+                self.deferred.add(job)
+                continue
+            if job.num_hosts - len(done) >= MIN_RELAUNCH_HOSTS:
+                # run_nmap sees relaunch_pps once nmap has stopped
+                job.relaunch_pps = pps
+                job.process.terminate()
+
+    def finished(self, job):
+        self.metrics.inc("scans_completed")
+        if job.start is not None:
+            self.metrics.observe("scan_seconds", time.monotonic() - job.start,
+                                 buckets=(1, 10, 60, 300, 900, 3600, 14400))
+        key = job.key()
+        self.remaining[key] -= 1
+        if self.remaining[key] == 0 and self.outputs[key] != [self.final_output(key)] and key not in self.merged:
+            self.verboseprint("[*] merging %d nmap runs for %s/%s" % (len(self.outputs[key]), job.protocol, job.port))
+            merge_gnmap(self.outputs[key], self.final_output(key))
+        self.update()
+
+    def update(self):
+        self.metrics.set("in_flight", len(self.running))
+        self.metrics.set("aggregate_pps", sum(job.pps for job in self.running))
+        self.metrics.update()
+
+    async def report_status(self):
+        """Updates the metrics every second. Rebalances every REBALANCE_INTERVAL seconds,
+        so a job skipped while it was being relaunched is not left at its old rate, and
+        as soon as a run rebalance() skipped has finished its first host."""
+        last_rebalance = time.monotonic()
+        while True:
+            self.update()
+            await asyncio.sleep(1)
+            if time.monotonic() - last_rebalance >= REBALANCE_INTERVAL or \
+                    any(job in self.running and completed_hosts(job.output_file) for job in self.deferred):
+                last_rebalance = time.monotonic()
+                self.rebalance()
+
+    async def supervise(self):
+        self.semaphore = asyncio.Semaphore(self.num_scans)
+        if self.states is not None:
+            self.resume()
+        else:
+            for job in self.jobs:
+                self.record(job, PENDING, save=False)
+                self.submit(job)
+            if self.manifest is not None:
+                self.manifest.save()
+        status = asyncio.ensure_future(self.report_status())
+        try:
+            # requeued jobs add tasks while the first ones run
+            while self.tasks:
+                await asyncio.gather(*list(self.tasks))
+        finally:
+            status.cancel()
+            for task in list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            # stop the nmap runs of the cancelled jobs before the event loop closes
+            await asyncio.gather(*(stop_process(p) for p in self.processes))
+
+    def run(self):
+        asyncio.run(self.supervise())
+
+
+async def stop_process(process, grace=5):
+    """Terminates a child process, killing it if it has not exited after grace seconds."""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def run_probe_jobs(directory, stage, manifest, num_scans, max_pps, args, report, verboseprint, metrics,
+                   intensity=None):
+    """Probes the host files in directory with nmap, split so no single nmap run holds up
+    the others. If the manifest has jobs for stage, the unfinished ones are resumed instead."""
+    entries = manifest.jobs(stage)
+    if entries:
+        jobs = [ProbeJob.from_fields(fields) for fields in entries.values()]
+        states = {fields["base"]: fields["state"] for fields in entries.values()}
+        outputs = {tuple(key.split("_", 1)): paths for key, paths in manifest.outputs(stage).items()}
+        print("[*] resuming %d of %d nmap runs" % (sum(state != DONE for state in states.values()), len(jobs)))
+    else:
+        jobs, chunk_size = plan_jobs(directory, num_scans, args.chunk_size, args.group_ports)
+        verboseprint("[*] %d nmap runs of at most %d hosts" % (len(jobs), chunk_size))
+        states = outputs = None
+    metrics.total += len(jobs)
+    supervisor = ProbeSupervisor(jobs, num_scans, max_pps, directory, metrics, verboseprint,
+                                 args.job_timeout, args.retries, report, intensity, manifest, stage,
+                                 states, outputs)
+    supervisor.run()
 
 
 def main():
@@ -140,6 +914,25 @@ def main():
     parser = argparse.ArgumentParser("verifies and reports on a masscan file")
     parser.add_argument("-x", "--exclude", required=False, help="ports to exclude, comma-sparated")
     parser.add_argument("-v", "--verbose", action="store_true", required=False, help="provide verbose output")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="processes to parse the scan file with")
+    parser.add_argument("-c", "--chunk-size", type=int, default=0,
+                        help="maximum hosts per nmap run, 0 picks a size that keeps all scans busy")
+    parser.add_argument("-g", "--group-ports", action="store_true",
+                        help="run one nmap per group of hosts with the same open ports instead of one per port")
+    parser.add_argument("-T", "--job-timeout", type=float, default=0,
+                        help="seconds before a nmap run is killed and its unfinished hosts queued again, 0 for no limit")
+    parser.add_argument("--retries", type=int, default=2, help="times a timed out nmap run is queued again")
+    parser.add_argument("-t", "--tiered", action="store_true",
+                        help="probe at --light-intensity first, then only the unidentified ports at --escalate-intensity")
+    parser.add_argument("--light-intensity", type=int, default=2, help="nmap --version-intensity of the first pass")
+    parser.add_argument("--escalate-intensity", type=int, default=9,
+                        help="nmap --version-intensity for the ports the first pass did not identify")
+    parser.add_argument("--resume", action="store_true",
+                        help="finish an interrupted run in its existing output directory")
+    add_cache_arguments(parser)
+    add_native_arguments(parser)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     parser.add_argument("scan_file", nargs=1, help="masscan file to use for verification and reporting")
     parser.add_argument("num_scans", nargs=1, help="number of scans to run concurrently")
     parser.add_argument("max_pps", nargs=1, help="maximum packets per second across all scans")
@@ -155,11 +948,14 @@ def main():
         scan_file_dir = "."
     output_directory = os.path.join(scan_file_dir, scan_file_base)
     report_output_file = os.path.join(output_directory, scan_file_base + ".csv")
-    assert not os.path.isdir(output_directory), "output directory %s already exists" % output_directory
+    if args.resume:
+        assert os.path.isfile(os.path.join(output_directory, "manifest.json")), \
+            "no job manifest in %s to resume from" % output_directory
+    else:
+        assert not os.path.isdir(output_directory), "output directory %s already exists" % output_directory
     
     num_scans = int(args.num_scans[0])
     max_pps = int(args.max_pps[0])
-    pps_per_scan = max(1, int(max_pps / num_scans))
 
     # options
     exclude_ports = []
@@ -171,19 +967,94 @@ def main():
         print("[*] enabling verbose output")
     verboseprint = print if verbose else lambda *a, **k: None
 
-    # make the directory
-    verboseprint("[*] creating directory")
-    os.mkdir(output_directory, 0o755)
+    if not args.resume:
+        # make the directory
+        verboseprint("[*] creating directory")
+        os.mkdir(output_directory, 0o755)
+    manifest = JobManifest(output_directory)
+    if not args.resume:
+        manifest.save()
 
-    parse_scan_file(scan_file, output_directory, exclude_ports, verboseprint)
+    profiler = profiler_from_args("verify_and_report", args)
+    metrics = metrics_from_args("verify_and_report", args, profiler=profiler)
+    if manifest.stage_done("report"):
+        print("[*] %s is complete, nothing to resume" % report_output_file)
+        return
+    if manifest.stage_done("parse"):
+        print("[*] resuming %s" % output_directory)
+    else:
+        assert not args.resume, "parsing %s did not finish, remove %s and start over" % (scan_file, output_directory)
+        with metrics.phase("parse"):
+            parse_scan_file(scan_file, output_directory, exclude_ports, verboseprint, metrics, args.jobs)
+        manifest.finish_stage("parse")
 
-    # output_directory is now full of files named protocol_port number.txt
-    host_files = os.listdir(output_directory)
-    host_files = [[pps_per_scan, os.path.join(output_directory, x)] for x in host_files]
-    with multiprocessing.Pool(processes=num_scans) as pool:
-        pool.map(probe_service, host_files)
-    
-    produce_report(output_directory, report_output_file, verboseprint)
+    metrics.inc("report_rows", 0)
+    with cache_from_args(args) or nullcontext() as cache, \
+            ServiceReport(report_output_file, verboseprint, metrics, cache, append=args.resume) as report:
+        try:
+            if cache is not None and not manifest.stage_done("cache"):
+                # hosts with a fresh cached result go straight to the report
+                metrics.inc("cache_hits", 0)
+                with metrics.phase("cache"):
+                    apply_cache(output_directory, cache, report, verboseprint, metrics)
+                manifest.finish_stage("cache")
+
+            prober = prober_from_args(args, max_pps, verboseprint)
+            if prober is not None and not manifest.stage_done("native"):
+                # common services are identified in-process, the rest is left to nmap
+                metrics.inc("native_identified", 0)
+                with metrics.phase("native"):
+                    probe_native(output_directory, prober, report, verboseprint, metrics)
+                manifest.finish_stage("native")
+
+            metrics.progress = "scans_completed"
+            metrics.total = 0
+            metrics.inc("scans_completed", 0)
+            metrics.inc("relaunches", 0)
+            # output_directory is now full of files named protocol_port number.txt
+            if args.tiered:
+                # a light first pass, only the ports it cannot identify are probed again in full
+                if not manifest.stage_done("probe"):
+                    report.hold = True
+                    with metrics.phase("probe"):
+                        run_probe_jobs(output_directory, "probe", manifest, num_scans, max_pps, args, report,
+                                       verboseprint, metrics, args.light_intensity)
+                    report.hold = False
+                    manifest.finish_stage("probe")
+                if not manifest.stage_done("escalate"):
+                    held = {key: row for key, row in gnmap_results(output_directory).items()
+                            if row[3] == "open" and unidentified(row[5])}
+                    escalate_directory = os.path.join(output_directory, "escalated")
+                    if not manifest.jobs("escalate"):
+                        write_escalated(escalate_directory, held)
+                    metrics.inc("escalated", len(held))
+                    print("[*] probing %d unidentified services again at intensity %d" %
+                          (len(held), args.escalate_intensity))
+                    with metrics.phase("escalate"):
+                        run_probe_jobs(escalate_directory, "escalate", manifest, num_scans, max_pps, args, report,
+                                       verboseprint, metrics, args.escalate_intensity)
+                    # report the first result of the ports the second probe has no result for
+                    replaced = gnmap_results(escalate_directory)
+                    report.add_results([row for key, row in held.items() if key not in replaced])
+                    manifest.finish_stage("escalate")
+            elif not manifest.stage_done("probe"):
+                with metrics.phase("probe"):
+                    run_probe_jobs(output_directory, "probe", manifest, num_scans, max_pps, args, report,
+                                   verboseprint, metrics)
+                manifest.finish_stage("probe")
+        except KeyboardInterrupt:
+            print("[-] interrupted, the running nmap scans have been stopped")
+            print("[*] the report %s has the results of the finished scans" % report_output_file)
+            print("[*] run again with --resume to finish the remaining scans")
+            metrics.finish(args.metrics_json)
+            profiler.finish()
+            sys.exit(1)
+        # sort and deduplicate the report
+        with metrics.phase("report"):
+            report.finish()
+        manifest.finish_stage("report")
+    metrics.finish(args.metrics_json)
+    profiler.finish()
     
 
 if __name__ == "__main__":